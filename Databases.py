@@ -1,8 +1,22 @@
+import os
 import sqlite3
 
+# Database file locations
+INVENTORY_DB = "inventory.db"
+SALESMAN_DB = "salesman.db"  # legacy: salesman records now live in inventory.db
+
+# Schema version kept in PRAGMA user_version
+SALESMAN_MERGED_VERSION = 1
+
+# Local time with milliseconds, as stored in every created_at column
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+# Part of every UPDATE of an inventory or salesman row, see add_row_versions
+BUMP_VERSION = f"version = version + 1, updated_at = {NOW_SQL}"
+
 # Database setup for inventory
-def create_db():
-    conn = sqlite3.connect("inventory.db")
+def create_db(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS inventory (
@@ -18,8 +32,10 @@ def create_db():
     conn.close()
 
 # Database setup for salesman
-def create_salesman_db():
-    conn = sqlite3.connect("salesman.db")
+# The salesman table sits next to inventory so an issue or return can
+# update both in a single transaction
+def create_salesman_db(path=INVENTORY_DB, legacy_path=SALESMAN_DB):
+    conn = sqlite3.connect(path)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS salesman (
@@ -37,4 +53,390 @@ def create_salesman_db():
     if "return" not in column_names:
         cursor.execute("ALTER TABLE salesman ADD COLUMN return INTEGER DEFAULT 0")
     conn.commit()
+
+    # Copy records from the old separate salesman.db the first time we run
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SALESMAN_MERGED_VERSION:
+        if os.path.exists(legacy_path):
+            merge_legacy_salesman_db(conn, legacy_path)
+        cursor.execute(f"PRAGMA user_version = {SALESMAN_MERGED_VERSION}")
+        conn.commit()
+    conn.close()
+
+def merge_legacy_salesman_db(conn, legacy_path):
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+    cursor.execute("SELECT name FROM legacy.sqlite_master WHERE type = 'table' AND name = 'salesman'")
+    if cursor.fetchone():
+        cursor.execute("PRAGMA legacy.table_info(salesman)")
+        legacy_columns = [column[1] for column in cursor.fetchall()]
+        return_column = "return" if "return" in legacy_columns else "0"
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO salesman (id, name, product, quantity, payment, return)
+            SELECT id, name, product, quantity, payment, COALESCE({return_column}, 0)
+            FROM legacy.salesman
+        """)
+        conn.commit()
+    cursor.execute("DETACH DATABASE legacy")
+
+# Indexes for the case-insensitive name lookups done on every sale
+INDEXES_VERSION = 2
+
+def create_indexes(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < INDEXES_VERSION:
+        # Product names are unique ignoring case; older databases may still hold
+        # duplicates, in which case a plain index keeps lookups fast anyway
+        try:
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_name ON inventory (LOWER(name))")
+        except sqlite3.IntegrityError:
+            print("Duplicate product names found in inventory, creating a non-unique name index")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_name ON inventory (LOWER(name))")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_salesman_name ON salesman (LOWER(name))")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_salesman_product ON salesman (LOWER(product))")
+        cursor.execute(f"PRAGMA user_version = {INDEXES_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Append-only ledger of every stock movement. inventory keeps the current
+# stock, updated in the same transaction as each movement is recorded
+MOVEMENTS_VERSION = 3
+
+def create_movements_table(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < MOVEMENTS_VERSION:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                product TEXT NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('receipt', 'issue', 'return', 'adjustment')),
+                quantity INTEGER NOT NULL,
+                price_per_kg REAL,
+                salesman TEXT,
+                salesman_record_id INTEGER,
+                created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_created_at ON stock_movements (created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_product ON stock_movements (product_id, created_at)")
+
+        # Opening balance for the stock that was there before the ledger existed
+        cursor.execute("""
+            INSERT INTO stock_movements (product_id, product, kind, quantity, price_per_kg)
+            SELECT id, LOWER(name), 'adjustment', quantity, price_per_kg
+            FROM inventory
+            WHERE id NOT IN (SELECT product_id FROM stock_movements)
+        """)
+        cursor.execute(f"PRAGMA user_version = {MOVEMENTS_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Trigram full-text index over product names and categories for the type-ahead
+# search. Triggers keep it in step with inventory; stock updates don't touch it
+SEARCH_VERSION = 4
+
+def create_search_index(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SEARCH_VERSION:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS inventory_search USING fts5(
+                name, category, content='inventory', content_rowid='id', tokenize='trigram'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS inventory_search_insert AFTER INSERT ON inventory BEGIN
+                INSERT INTO inventory_search (rowid, name, category) VALUES (new.id, new.name, new.category);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS inventory_search_delete AFTER DELETE ON inventory BEGIN
+                INSERT INTO inventory_search (inventory_search, rowid, name, category)
+                VALUES ('delete', old.id, old.name, old.category);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS inventory_search_update AFTER UPDATE OF name, category ON inventory BEGIN
+                INSERT INTO inventory_search (inventory_search, rowid, name, category)
+                VALUES ('delete', old.id, old.name, old.category);
+                INSERT INTO inventory_search (rowid, name, category) VALUES (new.id, new.name, new.category);
+            END
+        """)
+        # Index the products that are already there
+        cursor.execute("INSERT INTO inventory_search (inventory_search) VALUES ('rebuild')")
+        cursor.execute(f"PRAGMA user_version = {SEARCH_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Per-product minimum stock. The partial index holds just the products below
+# their level, so finding them never scans the whole inventory
+REORDER_VERSION = 5
+
+def add_reorder_levels(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < REORDER_VERSION:
+        cursor.execute("PRAGMA table_info(inventory)")
+        if "reorder_level" not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE inventory ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_inventory_low_stock ON inventory (id)
+            WHERE quantity < reorder_level
+        """)
+        cursor.execute(f"PRAGMA user_version = {REORDER_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Timestamped salesman records, and sales totals per salesman and product for
+# each day and each month. A trigger on the ledger keeps the totals up to date
+# as issues and returns are recorded, so period reports read a few summary
+# rows instead of every sale. Clearing the salesman records leaves them be.
+SALES_ROLLUP_VERSION = 6
+
+def rollup_upsert(table, period_column, period_length):
+    # Adds one issue or return movement (new.*) to a rollup table
+    return f"""
+        INSERT INTO {table} ({period_column}, salesman, product, issued, returned, issue_count, payment)
+        VALUES (substr(new.created_at, 1, {period_length}), LOWER(new.salesman), new.product,
+                CASE WHEN new.kind = 'issue' THEN -new.quantity ELSE 0 END,
+                CASE WHEN new.kind = 'return' THEN new.quantity ELSE 0 END,
+                new.kind = 'issue',
+                -new.quantity * COALESCE(new.price_per_kg, 0))
+        ON CONFLICT ({period_column}, salesman, product) DO UPDATE SET
+            issued = issued + excluded.issued,
+            returned = returned + excluded.returned,
+            issue_count = issue_count + excluded.issue_count,
+            payment = payment + excluded.payment;
+    """
+
+# Salesman records from before the ledger: their issue has no movement
+LEGACY_RECORDS = """
+    SELECT id FROM salesman
+    WHERE id NOT IN (SELECT salesman_record_id FROM stock_movements
+                     WHERE kind = 'issue' AND salesman_record_id IS NOT NULL)
+"""
+
+def backfill_sales_rollups(cursor):
+    # Totals for the sales made so far: from the ledger, plus the records
+    # from before the ledger existed. A legacy record's return and payment
+    # columns already take in every return made on it, so ledger returns
+    # against those records are left out rather than counted twice
+    history = f"""
+        SELECT created_at, LOWER(salesman) AS salesman, product,
+               CASE WHEN kind = 'issue' THEN -quantity ELSE 0 END AS issued,
+               CASE WHEN kind = 'return' THEN quantity ELSE 0 END AS returned,
+               kind = 'issue' AS issue_count,
+               -quantity * COALESCE(price_per_kg, 0) AS payment
+        FROM stock_movements
+        WHERE kind IN ('issue', 'return') AND salesman IS NOT NULL
+          AND (kind = 'issue' OR salesman_record_id IS NULL
+               OR salesman_record_id NOT IN ({LEGACY_RECORDS}))
+        UNION ALL
+        SELECT created_at, LOWER(name), LOWER(product), quantity, COALESCE(return, 0), 1, COALESCE(payment, 0)
+        FROM salesman
+        WHERE id IN ({LEGACY_RECORDS})
+    """
+    for table, period_column, period_length in (("sales_daily", "day", 10), ("sales_monthly", "month", 7)):
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} ({period_column}, salesman, product, issued, returned, issue_count, payment)
+            SELECT substr(created_at, 1, {period_length}), salesman, product,
+                   SUM(issued), SUM(returned), SUM(issue_count), SUM(payment)
+            FROM ({history})
+            GROUP BY 1, 2, 3
+        """)
+
+# A movement whose salesman record has since been cleared
+CLEARED_RECORD = "(salesman_record_id IS NULL OR salesman_record_id NOT IN (SELECT id FROM salesman))"
+
+def check_sales_rollups(conn):
+    # Compares the backfilled totals with the same totals counted straight
+    # from the records still held plus the ledger movements of cleared ones,
+    # and returns the mismatches. The records can't always vouch for the
+    # ledger: before SALESMAN_SEQUENCE_VERSION record ids were given out again
+    # after Clear Record, and before ROW_VERSION_VERSION a return replaced the
+    # one before it. So a mismatch is logged, and the rollups stay as built
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT (SELECT COALESCE(SUM(quantity), 0) FROM salesman)
+                 + (SELECT COALESCE(SUM(-quantity), 0) FROM stock_movements
+                    WHERE kind = 'issue' AND salesman IS NOT NULL AND {CLEARED_RECORD}),
+               (SELECT COALESCE(SUM(return), 0) FROM salesman)
+                 + (SELECT COALESCE(SUM(quantity), 0) FROM stock_movements
+                    WHERE kind = 'return' AND salesman IS NOT NULL AND {CLEARED_RECORD}),
+               (SELECT COUNT(*) FROM salesman)
+                 + (SELECT COUNT(*) FROM stock_movements
+                    WHERE kind = 'issue' AND salesman IS NOT NULL AND {CLEARED_RECORD})
+    """)
+    expected = cursor.fetchone()
+    mismatches = []
+    for table in ("sales_daily", "sales_monthly"):
+        cursor.execute(f"SELECT COALESCE(SUM(issued), 0), COALESCE(SUM(returned), 0), COALESCE(SUM(issue_count), 0) FROM {table}")
+        totals = cursor.fetchone()
+        if totals != expected:
+            mismatches.append(f"{table} totals (issued, returned, issues) {totals} don't match the sales records {expected}")
+    for mismatch in mismatches:
+        print(mismatch)
+    return mismatches
+
+def add_sales_rollups(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SALES_ROLLUP_VERSION:
+        cursor.execute("PRAGMA table_info(salesman)")
+        if "created_at" not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE salesman ADD COLUMN created_at TEXT")
+        # Older records take the time of their issue in the ledger, or now
+        cursor.execute(f"""
+            UPDATE salesman SET created_at = COALESCE(
+                (SELECT MIN(m.created_at) FROM stock_movements m
+                 WHERE m.kind = 'issue' AND m.salesman_record_id = salesman.id),
+                {NOW_SQL})
+            WHERE created_at IS NULL
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_salesman_created_at ON salesman (created_at)")
+
+        for table, period_column in (("sales_daily", "day"), ("sales_monthly", "month")):
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {period_column} TEXT NOT NULL,
+                    salesman TEXT NOT NULL,
+                    product TEXT NOT NULL,
+                    issued INTEGER NOT NULL DEFAULT 0,
+                    returned INTEGER NOT NULL DEFAULT 0,
+                    issue_count INTEGER NOT NULL DEFAULT 0,
+                    payment REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({period_column}, salesman, product)
+                ) WITHOUT ROWID
+            """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS sales_rollup AFTER INSERT ON stock_movements
+            WHEN new.kind IN ('issue', 'return') AND new.salesman IS NOT NULL
+            BEGIN
+                {rollup_upsert("sales_daily", "day", 10)}
+                {rollup_upsert("sales_monthly", "month", 7)}
+            END
+        """)
+
+        backfill_sales_rollups(cursor)
+        check_sales_rollups(conn)
+        cursor.execute(f"PRAGMA user_version = {SALES_ROLLUP_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Row versions for several workstations sharing the database. Every UPDATE
+# of an inventory or salesman row bumps its version (BUMP_VERSION), so an
+# edit made from values read earlier can check nothing changed in between:
+# UPDATE ... WHERE id = ? AND version = ?
+ROW_VERSION_VERSION = 7
+
+def add_row_versions(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < ROW_VERSION_VERSION:
+        for table in ("inventory", "salesman"):
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [column[1] for column in cursor.fetchall()]
+            if "version" not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "updated_at" not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+        cursor.execute(f"PRAGMA user_version = {ROW_VERSION_VERSION}")
+        conn.commit()
     conn.close()
+
+# Databases brought to SALES_ROLLUP_VERSION before the backfill left out
+# ledger returns against legacy records counted those returns twice; their
+# totals are built again and checked
+ROLLUP_REBUILD_VERSION = 8
+
+def rebuild_sales_rollups(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < ROLLUP_REBUILD_VERSION:
+        backfill_sales_rollups(cursor)
+        check_sales_rollups(conn)
+        cursor.execute(f"PRAGMA user_version = {ROLLUP_REBUILD_VERSION}")
+        conn.commit()
+    conn.close()
+
+# Salesman record ids are never given out twice, so the ledger's
+# salesman_record_id keeps pointing at one sale after Clear Record. The table
+# is rebuilt with AUTOINCREMENT, its sequence starting past every id the
+# ledger has seen
+SALESMAN_SEQUENCE_VERSION = 9
+
+def keep_salesman_ids(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SALESMAN_SEQUENCE_VERSION:
+        columns = "id, name, product, quantity, payment, return, created_at, version, updated_at"
+        # One transaction for the whole swap, DDL included
+        cursor.execute("BEGIN")
+        cursor.execute("""
+            CREATE TABLE salesman_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                product TEXT,
+                quantity INTEGER,
+                payment REAL,
+                return INTEGER DEFAULT 0,
+                created_at TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT
+            )
+        """)
+        cursor.execute(f"INSERT INTO salesman_new ({columns}) SELECT {columns} FROM salesman")
+        cursor.execute("DROP TABLE salesman")
+        cursor.execute("ALTER TABLE salesman_new RENAME TO salesman")
+        cursor.execute("CREATE INDEX idx_salesman_name ON salesman (LOWER(name))")
+        cursor.execute("CREATE INDEX idx_salesman_product ON salesman (LOWER(product))")
+        cursor.execute("CREATE INDEX idx_salesman_created_at ON salesman (created_at)")
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'salesman'")
+        cursor.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'salesman', MAX((SELECT COALESCE(MAX(id), 0) FROM salesman),
+                                   (SELECT COALESCE(MAX(salesman_record_id), 0) FROM stock_movements))
+        """)
+        cursor.execute(f"PRAGMA user_version = {SALESMAN_SEQUENCE_VERSION}")
+        conn.commit()
+    conn.close()
+
+# The version setup_databases() brings a database up to
+SCHEMA_VERSION = SALESMAN_SEQUENCE_VERSION
+
+def schema_version(path=INVENTORY_DB):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+# Creates or upgrades every table, in order. A database already at
+# SCHEMA_VERSION is left alone after a single PRAGMA, so the usual launch
+# doesn't re-probe each migration. Returns True when anything was run
+def setup_databases(path=INVENTORY_DB, legacy_path=SALESMAN_DB):
+    if os.path.exists(path) and schema_version(path) >= SCHEMA_VERSION:
+        return False
+    create_db(path)
+    create_salesman_db(path, legacy_path)
+    create_indexes(path)
+    create_movements_table(path)
+    create_search_index(path)
+    add_reorder_levels(path)
+    add_sales_rollups(path)
+    add_row_versions(path)
+    rebuild_sales_rollups(path)
+    keep_salesman_ids(path)
+    return True
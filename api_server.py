@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs, unquote
+import services
+from Databases import INVENTORY_DB, setup_databases
+from data_access import ConnectionManager
+from pdf_generator import generate_salesman_reports
+from report_data import build_report_data
+
+# Optional JSON API so other counters can look up stock and issue or return
+# it against the same database as the desktop app. Standard library only.
+#
+#   python api_server.py                      (http://127.0.0.1:8765, this machine only)
+#   python api_server.py --host 0.0.0.0       (reachable from the other counters)
+#
+#   GET  /products?search=lay&after=0&limit=100   inventory page (search is optional)
+#   GET  /products/<id>
+#   POST /products   {"name", "quantity", "price_per_kg", "category", "reorder_level"}
+#   GET  /low-stock
+#   GET  /sales?salesman=ali&after=0&limit=100
+#   POST /issue      {"salesman", "product", "quantity"}  or a list of them
+#   POST /return     {"record_id", "quantity"}            or a list of them
+#   GET  /reports/<salesman>                       the figures the PDF report is made of
+#   POST /reports    {"salesmen": [...]}           render PDF reports (all when omitted)
+#
+# Reads run in parallel on a pool of threads, each with its own connection
+# (WAL lets them read while a write is in progress). Every mutation goes
+# through one queue drained by a single writer, so SQLite never sees two
+# writers from this process fighting over the lock.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+READERS = 4
+MAX_BODY = 1024 * 1024
+PAGE_LIMIT = 1000  # largest page a client can ask for
+
+# HTTP status for each kind of ServiceError
+ERROR_STATUS = {
+    services.ProductNotFound: HTTPStatus.NOT_FOUND,
+    services.RecordNotFound: HTTPStatus.NOT_FOUND,
+    services.InsufficientStock: HTTPStatus.CONFLICT,
+    services.PriceConflict: HTTPStatus.CONFLICT,
+    services.EditConflict: HTTPStatus.CONFLICT,
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class ApiServer:
+    def __init__(self, db_path=INVENTORY_DB, readers=READERS):
+        self.db_path = db_path
+        self.read_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="api-reader")
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-writer")
+        self.local = threading.local()
+        self.reader_dbs = []
+        self.reader_lock = threading.Lock()
+        self.writer_db = ConnectionManager(db_path)
+        self.writes = None
+        self.writer_task = None
+
+        self.routes = [
+            ("GET", re.compile(r"/products"), self.list_products),
+            ("GET", re.compile(r"/products/(\d+)"), self.get_product),
+            ("POST", re.compile(r"/products"), self.add_product),
+            ("GET", re.compile(r"/low-stock"), self.low_stock),
+            ("GET", re.compile(r"/sales"), self.list_sales),
+            ("POST", re.compile(r"/issue"), self.issue),
+            ("POST", re.compile(r"/return"), self.return_stock),
+            ("GET", re.compile(r"/reports/([^/]+)"), self.report_data),
+            ("POST", re.compile(r"/reports"), self.render_reports),
+        ]
+
+    # Database access
+
+    def reader(self):
+        # Each reader thread keeps its own connection
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = ConnectionManager(self.db_path)
+            with self.reader_lock:
+                self.reader_dbs.append(db)
+        return db
+
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.read_pool, lambda: fn(self.reader(), *args))
+
+    async def write(self, fn, *args):
+        # Queue a mutation for the writer and wait for its result
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((fn, args, future))
+        return await future
+
+    async def writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, future = await self.writes.get()
+            try:
+                result = await loop.run_in_executor(self.write_pool, lambda: fn(self.writer_db, *args))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    # Endpoints: each takes (query, body, *path groups) and returns the JSON payload
+
+    async def list_products(self, query, body):
+        rows = await self.read(services.list_items, query_text(query, "search"), query_int(query, "after", 0),
+                               query_limit(query))
+        return [dict(zip(services.INVENTORY_COLUMNS, row)) for row in rows]
+
+    async def get_product(self, query, body, item_id):
+        rows = await self.read(lambda db: db.query(
+            f"SELECT {', '.join(services.INVENTORY_COLUMNS)} FROM inventory WHERE id = ?", (int(item_id),)))
+        if not rows:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No product with id {item_id}")
+        return dict(zip(services.INVENTORY_COLUMNS, rows[0]))
+
+    async def add_product(self, query, body):
+        item = require_object(body)
+        item_id = await self.write(services.add_item, item.get("name"), item.get("quantity"), item.get("price_per_kg"),
+                                   item.get("category", ""), item.get("reorder_level"))
+        return {"id": item_id}
+
+    async def low_stock(self, query, body):
+        rows = await self.read(services.list_low_stock)
+        return [dict(zip(services.LOW_STOCK_COLUMNS, row)) for row in rows]
+
+    async def list_sales(self, query, body):
+        rows = await self.read(services.list_sales, query_text(query, "salesman") or None, query_int(query, "after", 0),
+                               query_limit(query))
+        return [dict(zip(services.SALESMAN_COLUMNS, row)) for row in rows]
+
+    async def issue(self, query, body):
+        issues = [(item.get("salesman"), item.get("product"), item.get("quantity")) for item in require_objects(body)]
+        record_ids = await self.write(services.issue_many, issues)
+        return {"record_ids": record_ids}
+
+    async def return_stock(self, query, body):
+        returns = [(require_int(item, "record_id"), item.get("quantity")) for item in require_objects(body)]
+        record_ids = await self.write(services.return_many, returns)
+        return {"record_ids": record_ids}
+
+    async def report_data(self, query, body, salesman):
+        salesman = unquote(salesman)
+        reports = await self.read(lambda db: build_report_data(db.query, [salesman]))
+        if not reports:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No sales for '{salesman}'")
+        product_data, rates = reports[salesman.lower()]
+        return {"salesman": salesman.lower(),
+                "products": {product: dict(data, price_per_kg=rates[product]) for product, data in product_data.items()}}
+
+    async def render_reports(self, query, body):
+        salesmen = body.get("salesmen") if isinstance(body, dict) else None
+        if salesmen is not None and (not isinstance(salesmen, list) or not all(isinstance(name, str) for name in salesmen)):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "salesmen must be a list of names")
+        written, errors = await self.read(lambda db: generate_salesman_reports(db, salesmen=salesmen))
+        return {"written": written, "errors": [{"salesman": name, "path": path, "message": message}
+                                               for name, path, message in errors]}
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self.dispatch(method, target, body)
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            # The request couldn't even be read, answer and hang up
+            writer.write(encode_response(e.status, {"error": e.status.phrase, "message": e.message}, False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        allowed = []
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            try:
+                payload = await handler(parse_qs(url.query), parse_body(body), *match.groups())
+            except HttpError as e:
+                return e.status, {"error": e.status.phrase, "message": e.message}
+            except services.ServiceError as e:
+                return ERROR_STATUS.get(type(e), HTTPStatus.BAD_REQUEST), {"error": e.title, "message": e.message}
+            except Exception as e:
+                print(f"{method} {path} failed: {e!r}", file=sys.stderr)
+                return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Server Error", "message": str(e)}
+            return HTTPStatus.OK, payload
+        if allowed:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Method Not Allowed", "message": f"Use {' or '.join(allowed)}"}
+        return HTTPStatus.NOT_FOUND, {"error": "Not Found", "message": f"No endpoint {path}"}
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.writes = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.writer_task.cancel()
+
+    def close(self):
+        self.read_pool.shutdown(wait=True)
+        self.write_pool.shutdown(wait=True)
+        for db in self.reader_dbs:
+            db.close()
+        self.writer_db.close()
+
+async def read_request(reader):
+    # Returns (method, target, headers, body), or None once the client is done
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+def encode_response(status, payload, keep_alive):
+    body = json.dumps(payload).encode("utf-8")
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+def parse_body(body):
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "The request body is not valid JSON")
+
+def require_object(body):
+    if not isinstance(body, dict):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+    return body
+
+def require_objects(body):
+    # One object or a list of them
+    items = body if isinstance(body, list) else [require_object(body)]
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Expected a JSON object or a list of objects")
+    return items
+
+def require_int(item, key):
+    value = item.get(key)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"{key} must be an integer")
+    return value
+
+def query_text(query, key):
+    return query.get(key, [""])[0]
+
+def query_int(query, key, default):
+    try:
+        return int(query.get(key, [default])[0])
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"{key} must be an integer")
+
+def query_limit(query):
+    return max(1, min(query_int(query, "limit", 100), PAGE_LIMIT))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the inventory and sales over a local JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--db", default=INVENTORY_DB, help="database file (default: %(default)s)")
+    parser.add_argument("--readers", type=int, default=READERS, help="threads serving reads (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    setup_databases(args.db)
+    api = ApiServer(args.db, args.readers)
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import tkinter as tk
+import instrumentation
+from search import suggest_products, DEBOUNCE_MS
+
+class Autocomplete:
+    # Drop-down list of matching product names under an Entry.
+    # Looks products up once typing pauses; click a name or press Return to
+    # take it, Escape closes the list
+    def __init__(self, entry, var, fetch):
+        self.entry = entry
+        self.var = var
+        self.fetch = fetch
+        self.pending = None
+        self.choosing = False
+
+        self.listbox = tk.Listbox(entry.winfo_toplevel(), height=6, exportselection=False)
+        self.listbox.bind("<ButtonRelease-1>", self.choose)
+
+        self.var.trace_add("write", self.on_change)
+        self.entry.bind("<Return>", self.choose, add="+")
+        self.entry.bind("<Escape>", self.hide, add="+")
+        # Give a click on the list time to land before it disappears
+        self.entry.bind("<FocusOut>", lambda event: self.entry.after(200, self.hide), add="+")
+
+    def on_change(self, *args):
+        if self.choosing:
+            return
+        if self.pending is not None:
+            self.entry.after_cancel(self.pending)
+        self.pending = self.entry.after(DEBOUNCE_MS, self.update)
+
+    def update(self):
+        self.pending = None
+        with instrumentation.operation("autocomplete.suggest"):
+            names = suggest_products(self.fetch, self.var.get())
+        if not names or names == [self.var.get().strip()]:
+            self.hide()
+            return
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *names)
+        self.listbox.configure(height=len(names))
+        self.listbox.place(in_=self.entry, x=0, rely=1.0, relwidth=1.0)
+        self.listbox.lift()
+
+    def choose(self, event=None):
+        if not self.listbox.winfo_ismapped():
+            return
+        selection = self.listbox.curselection()
+        index = selection[0] if selection else 0
+        self.choosing = True
+        try:
+            self.var.set(self.listbox.get(index))
+        finally:
+            self.choosing = False
+        self.entry.icursor(tk.END)
+        self.hide()
+        return "break"
+
+    def hide(self, event=None):
+        if self.pending is not None:
+            self.entry.after_cancel(self.pending)
+            self.pending = None
+        self.listbox.place_forget()
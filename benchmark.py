@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from Databases import setup_databases
+from data_access import ConnectionManager
+import services
+from services import INVENTORY_COLUMNS, SALESMAN_COLUMNS
+from report_data import build_report_data, range_report_query, iter_period_reports, next_month
+import pdf_generator
+
+# Headless benchmark of the hot paths, run against synthetic databases of
+# growing size. The operations go through the service layer, the same calls
+# the Tk tabs hand to the background worker.
+#
+#   python benchmark.py --rows 1000 10000 100000 --output before.json
+#   python benchmark.py --rows 1000 10000 100000 --output after.json --compare before.json
+#
+# For every operation the first call is made under tracemalloc to record peak
+# memory and doubles as a warm-up; the remaining calls are timed untraced.
+
+DEFAULT_ROWS = [1000, 10000]
+OPERATIONS = 200        # calls per write operation
+LOAD_REPEATS = 5        # full table loads per table
+REPORT_SALESMEN = 20    # reports rendered per run
+SALESMEN_PER_ROWS = 100 # one salesman per this many sales rows
+SALES_DAYS = 90         # synthetic sales history
+
+def synthesize(path, rows, seed=0):
+    # rows products and rows sales records with their ledger movements.
+    # Returns (product names, salesman names)
+    rng = random.Random(seed)
+    setup_databases(path, os.path.join(os.path.dirname(path), "no-legacy.db"))
+    conn = sqlite3.connect(path)
+    categories = [f"category {i}" for i in range(50)]
+    products = [f"product {i:07d}" for i in range(rows)]
+    salesmen = [f"salesman {i:05d}" for i in range(max(1, rows // SALESMEN_PER_ROWS))]
+
+    with conn:
+        # Plenty of stock so the timed issues never run out
+        conn.executemany("""
+            INSERT INTO inventory (id, name, quantity, price_per_kg, total_price, category)
+            VALUES (?, ?, 1000000, ?, 1000000 * ?, ?)
+        """, ((i + 1, name, price, price, rng.choice(categories))
+              for i, (name, price) in enumerate((name, float(rng.randint(10, 500))) for name in products)))
+        prices = dict(conn.execute("SELECT name, price_per_kg FROM inventory"))
+
+        # Sales spread over the last SALES_DAYS days, oldest first
+        start = datetime.now() - timedelta(days=SALES_DAYS)
+        sales = []
+        for i in range(rows):
+            product = rng.choice(products)
+            quantity = rng.randint(1, 20)
+            created_at = (start + timedelta(days=SALES_DAYS * i / rows)).strftime("%Y-%m-%d %H:%M:%S.000")
+            sales.append((i + 1, rng.choice(salesmen), product, quantity, quantity * prices[product], created_at))
+        conn.executemany("INSERT INTO salesman (id, name, product, quantity, payment, created_at) VALUES (?, ?, ?, ?, ?, ?)", sales)
+        # The ledger trigger fills the daily and monthly rollups as it goes
+        conn.executemany("""
+            INSERT INTO stock_movements (product_id, product, kind, quantity, price_per_kg, salesman, salesman_record_id, created_at)
+            VALUES (?, ?, 'issue', ?, ?, ?, ?, ?)
+        """, ((int(product.split()[1]) + 1, product, -quantity, prices[product], name, record_id, created_at)
+              for record_id, name, product, quantity, _, created_at in sales))
+    conn.close()
+    return products, salesmen
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(fn, calls):
+    # calls: list of argument tuples. Returns the stats for fn over them
+    calls = list(calls)
+    tracemalloc.start()
+    try:
+        fn(*calls[0])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = []
+    start = time.perf_counter()
+    for args in calls[1:]:
+        call_start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "total_s": total,
+        "throughput_per_s": len(latencies) / total if total else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "peak_memory_kb": peak / 1024,
+    }
+
+def run_size(rows, workdir, operations=OPERATIONS, load_repeats=LOAD_REPEATS, report_salesmen=REPORT_SALESMEN, seed=0):
+    path = os.path.join(workdir, f"bench-{rows}.db")
+    start = time.perf_counter()
+    products, salesmen = synthesize(path, rows, seed)
+    print(f"{rows} rows: synthesized in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(seed + 1)
+    db = ConnectionManager(path)
+    db.products.load(db.query)
+    prices = dict(db.query("SELECT name, price_per_kg FROM inventory"))
+    results = {}
+
+    try:
+        # add_item: half merge into an existing product, half create a new one
+        def store(name, qty):
+            services.add_item(db, name, qty, prices.get(name, 25.0), "bench")
+        results["store_item"] = measure(store, [
+            (rng.choice(products) if i % 2 else f"new product {i}", rng.randint(1, 50)) for i in range(operations + 1)
+        ])
+
+        # add_salesman: issue stock; the records are returned below
+        issued = []
+        def issue(name, product, quantity):
+            issued.append((services.issue_stock(db, name, product, quantity), quantity))
+        results["issue_stock"] = measure(issue, [
+            (rng.choice(salesmen), rng.choice(products), rng.randint(2, 20)) for _ in range(operations + 1)
+        ])
+
+        # edit_salesman: return part of what was issued
+        results["return_stock"] = measure(lambda record_id, quantity: services.return_stock(db, record_id, quantity), [
+            (record_id, quantity // 2) for record_id, quantity in issued
+        ])
+
+        # view_inventory / view_salesmen: every row, and the first page as PagedTable shows it
+        results["load_inventory"] = measure(
+            lambda: db.query(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory"), [()] * (load_repeats + 1))
+        results["load_salesmen"] = measure(
+            lambda: db.query(f"SELECT {', '.join(SALESMAN_COLUMNS)} FROM salesman"), [()] * (load_repeats + 1))
+        results["first_page_inventory"] = measure(
+            lambda: db.query(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory WHERE id > ? ORDER BY id LIMIT 100", (0,)),
+            [()] * (load_repeats + 1))
+
+        # generate_salesman_reports: the report data alone, then full rendering
+        # for a sample of salesmen (rendering needs fpdf)
+        results["report_data"] = measure(lambda: build_report_data(db.query), [()] * (load_repeats + 1))
+        # This month's reports as generate_monthly_reports streams them
+        month_start = datetime.now().strftime("%Y-%m-01")
+        results["monthly_report_data"] = measure(
+            lambda: sum(1 for _ in iter_period_reports(db.query(*range_report_query(month_start, next_month(month_start))))),
+            [()] * (load_repeats + 1))
+        # The whole synthetic history as the range reports stream it
+        history_start = (datetime.now() - timedelta(days=SALES_DAYS)).strftime("%Y-%m-%d")
+        history_end = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        results["range_report_data"] = measure(
+            lambda: sum(1 for _ in iter_period_reports(db.query(*range_report_query(history_start, history_end)))),
+            [()] * (load_repeats + 1))
+
+        report_folder = os.path.join(workdir, f"reports-{rows}")
+        sample = salesmen[:report_salesmen]
+        errors = []
+        def reports(force):
+            _, failed = pdf_generator.generate_salesman_reports(db, salesmen=sample, base_folder=report_folder, force=force)
+            errors.extend(failed)
+        results["generate_reports"] = measure(reports, [(True,)] * 3)
+        results["generate_reports"]["salesmen"] = len(sample)
+        if errors:
+            results["generate_reports"]["error"] = errors[0][2]
+        # The same reports again with nothing changed: only the snapshots are checked
+        results["unchanged_reports"] = measure(reports, [(False,)] * 3)
+        results["product_cache"] = db.products.stats()
+    finally:
+        db.close()
+    return results
+
+def compare(results, baseline):
+    # Prints how each operation's p50 moved against an earlier run
+    for rows, operations in results["sizes"].items():
+        old_operations = baseline.get("sizes", {}).get(rows)
+        if not old_operations:
+            continue
+        print(f"\n{rows} rows vs {baseline.get('label') or 'baseline'}:")
+        for name, stats in operations.items():
+            old = old_operations.get(name, {})
+            if stats.get("p50_ms") and old.get("p50_ms"):
+                ratio = stats["p50_ms"] / old["p50_ms"]
+                flag = "  SLOWER" if ratio > 1.2 else ""
+                print(f"  {name:22} p50 {old['p50_ms']:9.3f}ms -> {stats['p50_ms']:9.3f}ms  x{ratio:.2f}{flag}")
+
+def print_results(rows, operations):
+    print(f"{rows} rows:")
+    for name, stats in operations.items():
+        if "p50_ms" not in stats:
+            continue
+        line = (f"  {name:22} {stats['throughput_per_s'] or 0:10.1f}/s  p50 {stats['p50_ms'] or 0:9.3f}ms"
+                f"  p99 {stats['p99_ms'] or 0:9.3f}ms  peak {stats['peak_memory_kb']:10.1f}KB")
+        if "error" in stats:
+            line += f"  ({stats['error']})"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inventory, sales and report hot paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="data sizes to run, products and sales rows each (default: %(default)s)")
+    parser.add_argument("--operations", type=int, default=OPERATIONS, help="calls per write operation (default: %(default)s)")
+    parser.add_argument("--report-salesmen", type=int, default=REPORT_SALESMEN,
+                        help="salesmen whose reports are rendered (default: %(default)s)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--label", help="name for this run, e.g. a version or commit")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic databases and reports")
+    args = parser.parse_args(argv)
+
+    results = {
+        "label": args.label,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "operations": args.operations,
+        "sizes": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="inventory-bench-")
+    try:
+        for rows in args.rows:
+            results["sizes"][str(rows)] = run_size(rows, workdir, args.operations, report_salesmen=args.report_salesmen)
+            print_results(rows, results["sizes"][str(rows)])
+    finally:
+        if args.keep:
+            print(f"Synthetic data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
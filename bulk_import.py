@@ -0,0 +1,183 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from itertools import islice
+from Databases import INVENTORY_DB, setup_databases
+from data_access import ConnectionManager
+import services
+
+# Bulk loading of supplier deliveries and salesman issues from CSV or JSON.
+# Files are read in chunks and every chunk goes through the batch services
+# (add_items, issue_many) in one transaction; bad rows are collected and
+# reported instead of stopping the load.
+#
+#   python bulk_import.py inventory delivery.csv    (name, quantity, price_per_kg, category)
+#   python bulk_import.py issues issues.jsonl       (salesman, product, quantity)
+
+CHUNK_SIZE = 500  # rows per transaction
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = []   # (line number, reason)
+        self.inventory_ids = set()  # products added to, by import_inventory
+        self.salesman_ids = set()   # records created, by import_issues
+
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+def read_rows(path):
+    # Yields (line number, row dict) without loading the whole file, or
+    # (line number, ValueError) for a .jsonl line that isn't valid JSON.
+    # .csv needs a header row; .jsonl/.ndjson hold one object per line;
+    # .json holds a single array of objects
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        elif extension in (".jsonl", ".ndjson"):
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    # A broken line is rejected like any other bad row
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, ValueError(f"invalid JSON ({e.msg})")
+        elif extension == ".json":
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError("A .json file must hold an array of objects")
+            for index, row in enumerate(rows, start=1):
+                yield index, row
+        else:
+            raise ValueError(f"Unsupported file type '{extension}', use .csv, .json or .jsonl")
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def check_row(row):
+    # read_rows() passes unreadable lines on as a ValueError to reject
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    return row
+
+def parse_number(row, key, convert):
+    value = row.get(key)
+    if value is None or str(value).strip() == "":
+        raise ValueError(f"missing {key}")
+    try:
+        # JSON true is not 1, and 2.7 is not a whole quantity
+        if isinstance(value, bool):
+            raise ValueError
+        number = convert(value)
+        if isinstance(value, float) and number != value:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid {key} '{value}'")
+    if number <= 0:
+        raise ValueError(f"{key} must be greater than 0")
+    return number
+
+def import_inventory(db, path, chunk_size=CHUNK_SIZE, progress=None):
+    # Same rules as adding a product by hand: a name that already exists with
+    # another price is rejected, the same name and price adds to its stock
+    result = ImportResult()
+    for chunk in chunks(read_rows(path), chunk_size):
+        import_inventory_chunk(db, chunk, result)
+        if progress is not None:
+            progress(result.imported + len(result.rejected), None)
+    return result
+
+def import_inventory_chunk(db, chunk, result):
+    valid = []
+    for line, row in chunk:
+        try:
+            row = check_row(row)
+            name = str(row.get("name") or "").strip().lower()
+            if not name:
+                raise ValueError("missing name")
+            qty = parse_number(row, "quantity", int)
+            price_per_kg = parse_number(row, "price_per_kg", float)
+            category = str(row.get("category") or "").strip().lower()
+        except ValueError as e:
+            result.reject(line, str(e))
+            continue
+        valid.append((line, (name, qty, price_per_kg, category)))
+
+    ids = apply_chunk(db, valid, services.add_items, result)
+    result.imported += len(ids)
+    result.inventory_ids.update(ids)
+
+def import_issues(db, path, chunk_size=CHUNK_SIZE, progress=None):
+    # Each row is issued like the Add Salesman form: only while enough stock is left
+    result = ImportResult()
+    for chunk in chunks(read_rows(path), chunk_size):
+        import_issues_chunk(db, chunk, result)
+        if progress is not None:
+            progress(result.imported + len(result.rejected), None)
+    return result
+
+def import_issues_chunk(db, chunk, result):
+    valid = []
+    for line, row in chunk:
+        try:
+            row = check_row(row)
+            name = str(row.get("salesman") or "").strip()
+            product = str(row.get("product") or "").strip()
+            if not name or not product:
+                raise ValueError("missing salesman or product")
+            quantity = parse_number(row, "quantity", int)
+        except ValueError as e:
+            result.reject(line, str(e))
+            continue
+        valid.append((line, (name, product, quantity)))
+
+    ids = apply_chunk(db, valid, services.issue_many, result)
+    result.imported += len(ids)
+    result.salesman_ids.update(ids)
+
+def apply_chunk(db, rows, apply_many, result):
+    # rows: [(line number, entry)]. The whole chunk goes through
+    # apply_many(db, entries, on_error) in one transaction, a row at fault
+    # being rolled back to its savepoint and rejected. Returns the ids of the
+    # rows applied
+    if not rows:
+        return []
+    ids = apply_many(db, [entry for _, entry in rows],
+                     on_error=lambda index, e: result.reject(rows[index][0], e.message))
+    return [row_id for row_id in ids if row_id is not None]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import inventory deliveries or salesman issues.")
+    parser.add_argument("kind", choices=["inventory", "issues"], help="what the file contains")
+    parser.add_argument("path", help=".csv, .json or .jsonl file")
+    parser.add_argument("--db", default=INVENTORY_DB, help="database file (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    setup_databases(args.db)
+    db = ConnectionManager(args.db)
+    try:
+        importer = import_inventory if args.kind == "inventory" else import_issues
+        result = importer(db, args.path, args.chunk_size)
+    finally:
+        db.close()
+
+    print(f"Imported {result.imported} rows, rejected {len(result.rejected)}")
+    for line, reason in sorted(result.rejected):
+        print(f"  line {line}: {reason}")
+    return 1 if result.rejected else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from Databases import INVENTORY_DB
+from product_cache import ProductCache
+import instrumentation
+
+# Connection tuning shared by every database the app opens
+BUSY_TIMEOUT_MS = 5000        # wait this long on a locked database before failing
+STATEMENT_CACHE_SIZE = 128    # prepared statements kept per connection
+BUSY_RETRIES = 3              # further attempts once the busy timeout has run out
+BUSY_BACKOFF_S = 0.1          # first pause between attempts, doubled each time
+
+def open_connection(path):
+    # The connection is shared with the background worker, access is guarded by ConnectionManager.lock
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    # WAL lets readers keep working while a sale is being written, and
+    # synchronous=NORMAL is durable enough in WAL mode without an fsync per commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+class ConnectionManager:
+    # Owns the long-lived connection to the database, shared by the managers.
+    # The main (Tk) thread reads on a connection of its own: with WAL it sees
+    # the last commit without waiting behind the lock while the background
+    # worker runs an import or a report query on the shared one
+    def __init__(self, path=INVENTORY_DB):
+        self.path = path
+        self.conn = open_connection(path)
+        self.lock = threading.RLock()
+        self.read_conn = None  # opened on the main thread's first query
+        self.listeners = {}
+        # Set by the app to run change listeners on the Tk thread
+        self.dispatch = None
+        # Product catalog cache, kept current by every mutation (write-through)
+        self.products = ProductCache()
+
+    def query(self, sql, params=()):
+        if threading.current_thread() is threading.main_thread():
+            if self.read_conn is None:
+                self.read_conn = open_connection(self.path)
+            rows = self.read_conn.execute(sql, params).fetchall()
+        else:
+            with self.lock:
+                rows = self.conn.execute(sql, params).fetchall()
+        if instrumentation.enabled:
+            instrumentation.count_query(len(rows))
+        return rows
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two counters
+        # working on the same stock are serialized instead of interleaved
+        with self.lock:
+            # Every write goes through here, so anything still open is a bug:
+            # committing it would save work nobody meant to save
+            if self.conn.in_transaction:
+                raise RuntimeError("a transaction was left open on the shared connection")
+            cursor = self.conn.cursor()
+            if instrumentation.enabled:
+                cursor = CountingCursor(cursor)
+            retry_on_busy(lambda: cursor.execute("BEGIN IMMEDIATE"))
+            try:
+                yield cursor
+            except BaseException:
+                self.conn.rollback()
+                raise
+            else:
+                try:
+                    # A busy COMMIT leaves the transaction open, so it can be tried again
+                    retry_on_busy(self.conn.commit)
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+
+    # Row-level change notifications: mutations report the ids they touched
+    # so views can patch just those rows instead of reloading everything
+    def subscribe(self, table, callback):
+        self.listeners.setdefault(table, []).append(callback)
+
+    def notify(self, table, ids):
+        # Listeners update widgets, so hand them to the Tk thread when called from a worker
+        if self.dispatch is not None and threading.current_thread() is not threading.main_thread():
+            self.dispatch(self.notify, table, ids)
+            return
+        for callback in self.listeners.get(table, []):
+            callback(ids)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.read_conn is not None:
+            self.read_conn.close()
+            self.read_conn = None
+
+def retry_on_busy(fn):
+    # Runs fn again when another workstation still holds the database after
+    # the busy timeout, pausing a little longer (with jitter) each time
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if attempt == BUSY_RETRIES or not is_busy(e):
+                raise
+            time.sleep(BUSY_BACKOFF_S * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def is_busy(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+class CountingCursor:
+    # Cursor handed out by transaction() while instrumentation is on: counts
+    # statements and fetched rows for the current operation
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=()):
+        instrumentation.count_query()
+        self.cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        instrumentation.count_query()
+        self.cursor.executemany(sql, rows)
+        return self
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            instrumentation.count_rows(1)
+        return row
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        instrumentation.count_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            instrumentation.count_rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount and the rest come straight from the cursor
+        return getattr(self.cursor, name)
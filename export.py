@@ -0,0 +1,191 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+from Databases import INVENTORY_DB
+
+# Streaming export of the inventory and sales data for accounting.
+# Rows are pulled from the cursor a batch at a time and written straight out,
+# so memory use stays flat however many rows there are.
+#
+#   python export.py inventory inventory.csv --category snacks
+#   python export.py sales_summary sales.parquet --start 2025-01-01 --end 2025-02-01
+#
+# CSV needs nothing extra; Parquet (compact, columnar) needs pyarrow installed.
+
+BATCH_SIZE = 5000
+
+# Each dataset: ((column, type), SQL, filters it supports). The types are
+# SQLite's and give the Parquet schema, so a column that starts out NULL
+# doesn't get its type guessed from the first batch
+DATASETS = {
+    "inventory": (
+        (
+            ("id", "integer"), ("name", "text"), ("quantity", "integer"), ("price_per_kg", "real"),
+            ("total_price", "real"), ("category", "text"), ("reorder_level", "integer"),
+        ),
+        "SELECT id, name, quantity, price_per_kg, total_price, category, reorder_level FROM inventory {where} ORDER BY id",
+        {"category": "LOWER(category) = LOWER(?)"},
+    ),
+    "salesman": (
+        (
+            ("id", "integer"), ("name", "text"), ("product", "text"), ("quantity", "integer"),
+            ("payment", "real"), ("return", "integer"), ("created_at", "text"),
+        ),
+        "SELECT id, name, product, quantity, payment, return, created_at FROM salesman {where} ORDER BY id",
+        {
+            "start": "created_at >= ?",
+            "end": "created_at < ?",
+            "salesman": "LOWER(name) = LOWER(?)",
+        },
+    ),
+    "movements": (
+        (
+            ("id", "integer"), ("created_at", "text"), ("kind", "text"), ("product_id", "integer"),
+            ("product", "text"), ("quantity", "integer"), ("price_per_kg", "real"), ("salesman", "text"),
+            ("salesman_record_id", "integer"),
+        ),
+        """SELECT id, created_at, kind, product_id, product, quantity, price_per_kg, salesman, salesman_record_id
+           FROM stock_movements {where} ORDER BY created_at, id""",
+        {
+            "start": "created_at >= ?",
+            "end": "created_at < ?",
+            "salesman": "LOWER(salesman) = LOWER(?)",
+            "category": "product_id IN (SELECT id FROM inventory WHERE LOWER(category) = LOWER(?))",
+        },
+    ),
+    # Issued, returned and sold quantities and payment per salesman and product, from the ledger
+    "sales_summary": (
+        (
+            ("salesman", "text"), ("product", "text"), ("category", "text"), ("issued", "integer"),
+            ("returned", "integer"), ("sold", "integer"), ("payment", "real"),
+        ),
+        """SELECT LOWER(m.salesman), m.product, i.category,
+                  SUM(CASE WHEN m.kind = 'issue' THEN -m.quantity ELSE 0 END),
+                  SUM(CASE WHEN m.kind = 'return' THEN m.quantity ELSE 0 END),
+                  -SUM(m.quantity),
+                  -SUM(m.quantity * m.price_per_kg)
+           FROM stock_movements m
+           LEFT JOIN inventory i ON i.id = m.product_id
+           {where}
+           GROUP BY LOWER(m.salesman), m.product
+           ORDER BY LOWER(m.salesman), m.product""",
+        {
+            "start": "m.created_at >= ?",
+            "end": "m.created_at < ?",
+            "salesman": "LOWER(m.salesman) = LOWER(?)",
+            "category": "LOWER(i.category) = LOWER(?)",
+        },
+    ),
+    # Totals per salesman and product for each day / month, from the rollup tables
+    "daily_sales": (
+        (
+            ("day", "text"), ("salesman", "text"), ("product", "text"), ("issued", "integer"),
+            ("returned", "integer"), ("issue_count", "integer"), ("payment", "real"),
+        ),
+        "SELECT day, salesman, product, issued, returned, issue_count, payment FROM sales_daily {where} ORDER BY day, salesman, product",
+        {"start": "day >= ?", "end": "day < ?", "salesman": "salesman = LOWER(?)"},
+    ),
+    "monthly_sales": (
+        (
+            ("month", "text"), ("salesman", "text"), ("product", "text"), ("issued", "integer"),
+            ("returned", "integer"), ("issue_count", "integer"), ("payment", "real"),
+        ),
+        "SELECT month, salesman, product, issued, returned, issue_count, payment FROM sales_monthly {where} ORDER BY month, salesman, product",
+        {"start": "month >= substr(?, 1, 7)", "end": "month < substr(?, 1, 7)", "salesman": "salesman = LOWER(?)"},
+    ),
+}
+# The summary only covers movements made by a salesman
+SUMMARY_CONDITION = "m.kind IN ('issue', 'return')"
+
+def build_query(dataset, filters):
+    # filters: {name: value}; filters the dataset doesn't support are an error
+    columns, sql, supported = DATASETS[dataset]
+    conditions = [SUMMARY_CONDITION] if dataset == "sales_summary" else []
+    params = []
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in supported:
+            raise ValueError(f"The {dataset} export can't be filtered by {name}")
+        conditions.append(supported[name])
+        params.append(value)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    return columns, sql.format(where=where), tuple(params)
+
+def iter_rows(conn, sql, params=(), batch_size=BATCH_SIZE):
+    # Yields lists of rows, never more than batch_size at a time
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+def write_csv(path, columns, batches):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(name for name, _ in columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+def write_parquet(path, columns, batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    types = {"integer": pa.int64(), "real": pa.float64(), "text": pa.string()}
+    schema = pa.schema([(name, types[column_type]) for name, column_type in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in batches:
+            # Transpose the batch into columns, one row group per batch
+            writer.write_table(pa.Table.from_pydict(
+                {name: list(values) for name, values in zip(schema.names, zip(*rows))}, schema=schema))
+            count += len(rows)
+    return count
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+def export(dataset, path, db_path=INVENTORY_DB, fmt=None, batch_size=BATCH_SIZE, **filters):
+    # Returns the number of rows written. fmt defaults to the file extension
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format '{fmt}', use csv or parquet")
+    columns, sql, params = build_query(dataset, filters)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        return WRITERS[fmt](path, columns, iter_rows(conn, sql, params, batch_size))
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export inventory and sales data to CSV or Parquet.")
+    parser.add_argument("dataset", choices=sorted(DATASETS), help="what to export")
+    parser.add_argument("path", help="output file (.csv or .parquet)")
+    parser.add_argument("--db", default=INVENTORY_DB, help="database file (default: %(default)s)")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format (default: from the file extension)")
+    parser.add_argument("--start", help="only movements on or after this date, YYYY-MM-DD")
+    parser.add_argument("--end", help="only movements before this date, YYYY-MM-DD")
+    parser.add_argument("--salesman", help="only this salesman")
+    parser.add_argument("--category", help="only products in this category")
+    args = parser.parse_args(argv)
+
+    try:
+        count = export(args.dataset, args.path, args.db, args.format,
+                       start=args.start, end=args.end, salesman=args.salesman, category=args.category)
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Exported {count} rows to {args.path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Opt-in timing for database, table and report work. Nothing is measured
+# until enable() is called (python main.py --instrument); after that every
+# operation records its wall time, the SQL statements it ran, the rows it
+# fetched and any extra timings noted inside it (Treeview inserts, PDF
+# rendering and writing). The latest records are kept for the stats window
+# and each one is appended to a JSON lines log.
+#
+#   with operation("inventory.load_next"):
+#       rows = db.query(...)          # counted by ConnectionManager
+#       with timer("tree_insert_ms"):
+#           ...
+#
+# profile_next() runs the next operation under cProfile and saves its stats.
+
+WINDOW = 1000  # operations kept for the stats window
+DEFAULT_LOG = "metrics.jsonl"
+
+enabled = False
+log_path = None
+records = deque(maxlen=WINDOW)
+lock = threading.Lock()
+local = threading.local()
+profile_request = None  # operation name to profile next ("" for any), or None
+last_profile = None     # path of the latest .prof file
+
+class Operation:
+    __slots__ = ("name", "start", "queries", "rows", "extra")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.rows = 0
+        self.extra = {}
+
+def enable(path=DEFAULT_LOG):
+    # Start measuring; path is the metrics log (None for no log)
+    global enabled, log_path
+    log_path = path
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def active():
+    # The operations open on this thread, innermost last
+    stack = getattr(local, "stack", None)
+    if stack is None:
+        stack = local.stack = []
+    return stack
+
+@contextmanager
+def operation(name):
+    if not enabled:
+        yield
+        return
+    profiler = start_profile(name)
+    current = Operation(name)
+    stack = active()
+    stack.append(current)
+    failed = False
+    try:
+        yield current
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        stack.pop()
+        wall_ms = (time.perf_counter() - current.start) * 1000
+        if profiler is not None:
+            finish_profile(profiler, name)
+        record({
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "operation": name,
+            "wall_ms": round(wall_ms, 3),
+            "queries": current.queries,
+            "rows": current.rows,
+            "failed": failed,
+            "thread": threading.current_thread().name,
+            **{key: round(value, 3) for key, value in current.extra.items()},
+        })
+
+def record_timing(name, wall_ms):
+    # A span measured outside operation(), e.g. startup
+    if enabled:
+        record({
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "operation": name,
+            "wall_ms": round(wall_ms, 3),
+            "queries": 0,
+            "rows": 0,
+            "failed": False,
+            "thread": threading.current_thread().name,
+        })
+
+def count_query(rows=0):
+    # Called for every SQL statement run through ConnectionManager
+    for current in active():
+        current.queries += 1
+        current.rows += rows
+
+def count_rows(rows):
+    for current in active():
+        current.rows += rows
+
+def note(key, value):
+    # Adds value to a named measurement of the open operations, e.g. "render_ms"
+    for current in active():
+        current.extra[key] = current.extra.get(key, 0) + value
+
+@contextmanager
+def timer(key):
+    # Notes the time spent inside, in milliseconds, under key
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        note(key, (time.perf_counter() - start) * 1000)
+
+def record(entry):
+    with lock:
+        records.append(entry)
+        if log_path:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+def reset():
+    with lock:
+        records.clear()
+
+def summary():
+    # Per operation over the rolling window: count, total/avg/p50/p99/max wall
+    # time, average queries and rows, and the average of each extra measurement
+    with lock:
+        entries = list(records)
+    by_name = {}
+    for entry in entries:
+        if "profiled" in entry:
+            continue
+        by_name.setdefault(entry["operation"], []).append(entry)
+
+    result = {}
+    for name, group in by_name.items():
+        times = sorted(entry["wall_ms"] for entry in group)
+        count = len(group)
+        stats = {
+            "count": count,
+            "failed": sum(1 for entry in group if entry["failed"]),
+            "total_ms": sum(times),
+            "avg_ms": sum(times) / count,
+            "p50_ms": times[int(0.50 * (count - 1))],
+            "p99_ms": times[int(round(0.99 * (count - 1)))],
+            "max_ms": times[-1],
+            "queries": sum(entry["queries"] for entry in group) / count,
+            "rows": sum(entry["rows"] for entry in group) / count,
+        }
+        extra_keys = {key for entry in group for key in entry if key.endswith("_ms") and key != "wall_ms"}
+        for key in sorted(extra_keys):
+            stats[key] = sum(entry.get(key, 0) for entry in group) / count
+        result[name] = stats
+    return result
+
+# cProfile capture
+
+def profile_next(name=""):
+    # Profile the next operation called name (any operation when empty)
+    global profile_request
+    profile_request = name
+
+def start_profile(name):
+    global profile_request
+    with lock:
+        if profile_request is None or profile_request not in ("", name) or active():
+            return None
+        profile_request = None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def finish_profile(profiler, name):
+    # Saves the .prof file next to the metrics log and logs the top functions
+    global last_profile
+    profiler.disable()
+    folder = os.path.dirname(log_path) if log_path else ""
+    path = os.path.join(folder, f"profile-{name}-{datetime.now():%Y%m%d-%H%M%S}.prof")
+    profiler.dump_stats(path)
+    last_profile = path
+    stats = pstats.Stats(profiler)
+    top = [
+        {"function": f"{func[0]}:{func[1]}({func[2]})", "calls": nc, "cumulative_ms": round(ct * 1000, 3)}
+        for func, (cc, nc, tt, ct, callers) in sorted(stats.stats.items(), key=lambda item: -item[1][3])[:20]
+    ]
+    record({"at": datetime.now().isoformat(timespec="milliseconds"), "operation": "profile", "profiled": name,
+            "path": path, "top": top, "wall_ms": 0, "queries": 0, "rows": 0, "failed": False})
@@ -1,10 +1,19 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import sqlite3
+from tkinter import ttk, messagebox, filedialog
+from paged_tree import PagedTable
+import instrumentation
+import services
+from services import INVENTORY_COLUMNS, ServiceError, EditConflict
+from bulk_import import import_inventory
+from search import match_clause, DEBOUNCE_MS
+from low_stock import LowStockPanel
 
 class InventoryManager:
-    def __init__(self, root):
+    def __init__(self, root, db, jobs):
         self.root = root
+        self.db = db
+        self.jobs = jobs  # database work runs on the background worker
+        self.filter_pending = None
 
     def create_inventory_tab(self, notebook):
         # Inventory Tab UI setup (similar to original setup_inventory_tab)
@@ -47,6 +56,11 @@ class InventoryManager:
         self.product_category_entry = tk.Entry(input_frame, textvariable=self.product_category_var)
         self.product_category_entry.grid(row=3, column=1, padx=5, pady=5)
 
+        tk.Label(input_frame, text="Reorder Level", bg="#ffffff").grid(row=4, column=0, padx=5, pady=5)
+        self.product_reorder_var = tk.IntVar()
+        self.product_reorder_entry = tk.Entry(input_frame, textvariable=self.product_reorder_var)
+        self.product_reorder_entry.grid(row=4, column=1, padx=5, pady=5)
+
         # Bind arrow keys for navigation
         self.product_name_entry.bind("<Down>", self.move_to_quantity)
         self.product_quantity_entry.bind("<Up>", self.move_to_product_name)
@@ -54,30 +68,64 @@ class InventoryManager:
         self.product_price_entry.bind("<Up>", self.move_to_quantity)
         self.product_price_entry.bind("<Down>", self.move_to_category)
         self.product_category_entry.bind("<Up>", self.move_to_price)
+        self.product_category_entry.bind("<Down>", self.move_to_reorder_level)
+        self.product_reorder_entry.bind("<Up>", self.move_to_category)
 
         # Buttons
-        tk.Button(input_frame, text="Add Product", command=self.add_item, bg="#4caf50", fg="white").grid(row=4, column=0, padx=5, pady=10)
-        tk.Button(input_frame, text="View Inventory", command=self.view_inventory, bg="#2196f3", fg="white").grid(row=4, column=1, padx=5, pady=10)
+        tk.Button(input_frame, text="Add Product", command=self.add_item, bg="#4caf50", fg="white").grid(row=5, column=0, padx=5, pady=10)
+        tk.Button(input_frame, text="View Inventory", command=self.view_inventory, bg="#2196f3", fg="white").grid(row=5, column=1, padx=5, pady=10)
+        tk.Button(input_frame, text="Import", command=self.import_items, bg="#9c27b0", fg="white").grid(row=5, column=2, padx=5, pady=10)
+
+        # Products below their reorder level, kept up to date as stock changes
+        self.low_stock_panel = LowStockPanel(input_frame, self.db)
+        self.low_stock_panel.frame.grid(row=0, column=3, rowspan=6, padx=15, pady=5, sticky="nsew")
+        input_frame.grid_columnconfigure(3, weight=1)
+
+        # Search box filtering the table by name or category
+        filter_frame = tk.Frame(table_frame, bg="#ffffff")
+        filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        tk.Label(filter_frame, text="Search", bg="#ffffff").pack(side=tk.LEFT, padx=5)
+        self.filter_var = tk.StringVar()
+        tk.Entry(filter_frame, textvariable=self.filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.filter_var.trace_add("write", self.schedule_filter)
 
         # Inventory Table
-        self.inventory_tree = ttk.Treeview(table_frame, columns=("ID", "Name", "Quantity", "Price per KG", "Total Price", "Category"), show="headings")
+        self.inventory_tree = ttk.Treeview(table_frame, columns=("ID", "Name", "Quantity", "Price per KG", "Total Price", "Category", "Reorder Level"), show="headings")
         self.inventory_tree.heading("ID", text="ID")
         self.inventory_tree.heading("Name", text="Name")
         self.inventory_tree.heading("Quantity", text="Quantity")
         self.inventory_tree.heading("Price per KG", text="Price per KG")
         self.inventory_tree.heading("Total Price", text="Total Price")
         self.inventory_tree.heading("Category", text="Category")
+        self.inventory_tree.heading("Reorder Level", text="Reorder Level")
         
-        for col in ["ID", "Name", "Quantity", "Price per KG", "Total Price", "Category"]:
+        for col in ["ID", "Name", "Quantity", "Price per KG", "Total Price", "Category", "Reorder Level"]:
             self.inventory_tree.column(col, anchor="center")
 
         # Add scrollbar
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.inventory_tree.yview)
-        self.inventory_tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # Rows are fetched page by page as the table is scrolled
+        self.inventory_table = PagedTable(self.inventory_tree, scrollbar, self.db, "inventory", INVENTORY_COLUMNS)
+
         self.inventory_tree.pack(fill=tk.BOTH, expand=True)
-        self.view_inventory()
+
+    def load_data(self, on_done=None):
+        # First page and low-stock list, read on the worker once the window
+        # has been drawn and shown when they arrive
+        def show(rows):
+            first_page, low_stock = rows
+            self.inventory_table.reload(first_page)
+            self.low_stock_panel.reload(low_stock)
+            self.inventory_tree.bind("<Button-3>", self.show_context_menu)
+            if on_done is not None:
+                on_done()
+
+        self.jobs.submit(self.read_first_rows, on_done=show, on_error=self.show_error, description="Loading inventory...")
+
+    def read_first_rows(self):
+        return self.inventory_table.first_page(), services.list_low_stock(self.db)
         
     #Cursor movements
     def move_to_product_name(self, event=None):
@@ -92,77 +140,52 @@ class InventoryManager:
     def move_to_category(self, event=None):
         self.product_category_entry.focus_set()
 
+    def move_to_reorder_level(self, event=None):
+        self.product_reorder_entry.focus_set()
+
     def add_item(self):
         name = self.product_name_var.get().strip().lower()
         qty = self.product_quantity_var.get()
         price_per_kg = self.product_price_var.get()
         category = self.product_category_var.get().strip().lower()
+        reorder_level = self.product_reorder_var.get()
 
         if not name or not qty or not price_per_kg:
             messagebox.showwarning("Input Error", "All fields except category are required!")
             return
 
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
+        # A name that exists with another price comes back as a PriceConflict
+        self.jobs.submit(services.add_item, self.db, name, qty, price_per_kg, category, reorder_level or None,
+                         on_done=lambda _: self.clear_inputs(), on_error=self.show_error, description="Saving product...")
 
-        # Check if an item with the same name (case-insensitive) exists and has a different price_per_kg
-        cursor.execute("""
-            SELECT id, quantity, price_per_kg FROM inventory 
-            WHERE LOWER(name) = ? AND price_per_kg != ? 
-        """, (name, price_per_kg))
-        
-        existing_item = cursor.fetchone()
-
-        if existing_item:
-            # If item with the same name exists but different price per kg, show error
-            messagebox.showwarning("Price Error", "An item with the same name but a different price already exists!")
-            conn.close()
+    def import_items(self):
+        # Load a supplier delivery from a CSV/JSON file in the background
+        path = filedialog.askopenfilename(title="Import Inventory",
+                                          filetypes=[("CSV or JSON", "*.csv *.json *.jsonl *.ndjson"), ("All files", "*.*")])
+        if not path:
             return
 
-        # Check if an item with the same name and price per kg (case-insensitive) exists
-        cursor.execute("""
-            SELECT id, quantity, price_per_kg FROM inventory 
-            WHERE LOWER(name) = ? AND price_per_kg = ?
-        """, (name, price_per_kg))
-        existing_item = cursor.fetchone()
-
-        if existing_item:
-            # Update quantity and total price of the existing item
-            item_id, existing_qty, _ = existing_item
-            new_qty = existing_qty + qty
-            total_price = new_qty * price_per_kg
-            cursor.execute("""
-                UPDATE inventory
-                SET quantity = ?, total_price = ?
-                WHERE id = ?
-            """, (new_qty, total_price, item_id))
-        else:
-            # Add new item
-            total_price = qty * price_per_kg
-            cursor.execute("""
-                INSERT INTO inventory (name, quantity, price_per_kg, total_price, category)
-                VALUES (?, ?, ?, ?, ?)
-            """, (name, qty, price_per_kg, total_price, category))
-
-        conn.commit()
-        conn.close()
+        def progress(done, total):
+            self.jobs.status_var.set(f"Importing... {done} rows read")
 
-        self.clear_inputs()
-        self.view_inventory()
+        self.jobs.submit(import_inventory, self.db, path,
+                         on_done=lambda result: show_import_result(result), on_error=self.show_error,
+                         on_progress=progress, description="Importing inventory...")
 
-    def view_inventory(self):
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM inventory")
-        rows = cursor.fetchall()
-        conn.close()
+    def schedule_filter(self, *args):
+        # Filter once typing pauses rather than on every key press
+        if self.filter_pending is not None:
+            self.inventory_tree.after_cancel(self.filter_pending)
+        self.filter_pending = self.inventory_tree.after(DEBOUNCE_MS, self.apply_filter)
 
-        # Clear the tree before inserting
-        for row in self.inventory_tree.get_children():
-            self.inventory_tree.delete(row)
+    def apply_filter(self):
+        self.filter_pending = None
+        with instrumentation.operation("inventory.filter"):
+            self.inventory_table.set_filter(*match_clause(self.filter_var.get()))
 
-        for row in rows:
-            self.inventory_tree.insert("", tk.END, values=row)
+    def view_inventory(self):
+        # Show the first page again
+        self.inventory_table.reload()
 
         # Bind right-click menu
         self.inventory_tree.bind("<Button-3>", self.show_context_menu)
@@ -178,14 +201,22 @@ class InventoryManager:
             context_menu.post(event.x_root, event.y_root)
 
     def edit_item(self, item):
+        # Start from the item as it is in the database now, not the row on
+        # screen, and remember its version to save against
         item_id = self.inventory_tree.item(item, "values")[0]
-        current_qty = self.inventory_tree.item(item, "values")[2]
-        current_price = self.inventory_tree.item(item, "values")[3]
+        try:
+            seen = services.get_item(self.db, item_id)
+        except ServiceError as e:
+            self.show_error(e)
+            return
+        current_qty = seen["quantity"]
+        current_price = seen["price_per_kg"]
+        current_reorder_level = seen["reorder_level"]
 
         # Create a custom dialog for editing
         dialog = tk.Toplevel(self.root)
         dialog.title("Edit Item")
-        dialog.geometry("300x200")
+        dialog.geometry("300x260")
         dialog.transient(self.root)  # Make it a child of the main window
         dialog.grab_set()  # Make it modal
 
@@ -199,12 +230,18 @@ class InventoryManager:
         price_var = tk.DoubleVar(value=current_price)
         tk.Entry(dialog, textvariable=price_var).pack(pady=5)
 
+        # Reorder level input
+        tk.Label(dialog, text="Reorder Level:").pack(pady=5)
+        reorder_var = tk.IntVar(value=current_reorder_level)
+        tk.Entry(dialog, textvariable=reorder_var).pack(pady=5)
+
         # Buttons
         def save_changes():
             new_qty = qty_var.get()
             new_price_per_kg = price_var.get()
+            new_reorder_level = reorder_var.get()
             if new_qty is not None and new_price_per_kg is not None:
-                self.update_quantity_and_price(item_id, new_qty, new_price_per_kg)
+                self.save_item(item_id, seen, new_qty, new_price_per_kg, new_reorder_level)
             dialog.destroy()
 
         tk.Button(dialog, text="Save", command=save_changes).pack(pady=10)
@@ -212,39 +249,68 @@ class InventoryManager:
 
         dialog.mainloop()
 
-    def update_quantity_and_price(self, item_id, new_qty, new_price_per_kg):
-        # Recalculate the total price based on the new values
-        total_price = new_qty * new_price_per_kg
-        
-        # Update the database with the new quantity, price per kg, and total price
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE inventory 
-            SET quantity = ?, price_per_kg = ?, total_price = ? 
-            WHERE id = ?
-        """, (new_qty, new_price_per_kg, total_price, item_id))
-        conn.commit()
-        conn.close()
-
-        self.view_inventory()
-        messagebox.showinfo("Updated", "Item updated successfully!")
+    def save_item(self, item_id, seen, new_qty, new_price_per_kg, new_reorder_level):
+        # seen: the item the new values were based on (services.get_item)
+        def failed(error):
+            if isinstance(error, EditConflict):
+                self.resolve_conflict(item_id, seen, error.current, new_qty, new_price_per_kg, new_reorder_level)
+            else:
+                self.show_error(error)
+
+        self.jobs.submit(services.adjust_item, self.db, item_id, new_qty, new_price_per_kg, new_reorder_level,
+                         version=seen["version"],
+                         on_done=lambda _: messagebox.showinfo("Updated", "Item updated successfully!"),
+                         on_error=failed, description="Updating product...")
+
+    def resolve_conflict(self, item_id, seen, current, new_qty, new_price_per_kg, new_reorder_level):
+        # Someone else saved the item first: apply this edit on top of theirs,
+        # overwrite theirs, or drop this one
+        change = new_qty - seen["quantity"]
+        answer = messagebox.askyesnocancel(
+            "Edit Conflict",
+            f"'{current['name']}' was changed on another workstation while you were editing it.\n\n"
+            f"Quantity: {seen['quantity']} when you opened it, {current['quantity']} now, {new_qty} in your edit\n"
+            f"Price per kg: {seen['price_per_kg']} when you opened it, {current['price_per_kg']} now, {new_price_per_kg} in your edit\n\n"
+            f"Yes: keep their change and apply yours on top (quantity {change:+d}, your price and reorder level)\n"
+            f"No: replace their change with your values\n"
+            f"Cancel: discard your edit",
+        )
+        if answer is None:
+            return
+        if answer:
+            self.jobs.submit(services.adjust_item_by, self.db, item_id, change, new_price_per_kg, new_reorder_level,
+                             on_done=lambda _: messagebox.showinfo("Updated", "Item updated successfully!"),
+                             on_error=self.show_error, description="Updating product...")
+        else:
+            # Saved against the version just seen, so a further change asks again
+            self.save_item(item_id, current, new_qty, new_price_per_kg, new_reorder_level)
 
     def delete_item_by_tree(self, item):
         item_id = self.inventory_tree.item(item, "values")[0]
-        self.delete_item(item_id)
+        self.jobs.submit(services.delete_item, self.db, item_id,
+                         on_done=lambda _: messagebox.showinfo("Deleted", "Item deleted successfully!"),
+                         on_error=self.show_error, description="Deleting product...")
 
     def clear_inputs(self):
         self.product_name_var.set("")
         self.product_quantity_var.set(0)
         self.product_price_var.set(0.0)
         self.product_category_var.set("")
+        self.product_reorder_var.set(0)
 
-    def delete_item(self, item_id):
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM inventory WHERE id = ?", (item_id,))
-        conn.commit()
-        conn.close()
-        self.view_inventory()
-        messagebox.showinfo("Deleted", "Item deleted successfully!")
\ No newline at end of file
+    def show_error(self, error):
+        if isinstance(error, ServiceError):
+            messagebox.showwarning(error.title, error.message)
+        else:
+            messagebox.showerror("Database Error", str(error))
+
+def show_import_result(result, limit=20):
+    # Summary of a bulk import, listing the first rejected rows
+    message = f"Imported {result.imported} rows, rejected {len(result.rejected)}."
+    if result.rejected:
+        lines = [f"Line {line}: {reason}" for line, reason in sorted(result.rejected)[:limit]]
+        if len(result.rejected) > limit:
+            lines.append(f"... and {len(result.rejected) - limit} more")
+        messagebox.showwarning("Import Finished", message + "\n\n" + "\n".join(lines))
+    else:
+        messagebox.showinfo("Import Finished", message)
@@ -0,0 +1,85 @@
+import queue
+import sys
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+
+class JobExecutor:
+    # Runs database and report work on background threads so the Tk mainloop
+    # never blocks. Results, errors and progress are queued and handed back to
+    # the Tk thread with root.after, the only thread allowed to touch widgets.
+    POLL_MS = 50
+
+    def __init__(self, root, max_workers=1):
+        self.root = root
+        # A single worker keeps writes to SQLite in submission order
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inventory-worker")
+        self.callbacks = queue.Queue()
+        self.pending = 0
+        self.polling = False
+        self.status_var = tk.StringVar(master=root, value="Ready")
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, description="Working...", **kwargs):
+        # fn(*args, **kwargs) runs on a worker thread. When on_progress is given, fn also gets a
+        # progress(done, total) keyword argument it can call as it goes
+        self.pending += 1
+        self.status_var.set(description)
+        if on_progress is not None:
+            kwargs["progress"] = lambda done, total: self.call_soon(on_progress, done, total)
+
+        # Each job is one operation in the instrumentation stats
+        name = f"{getattr(fn, '__module__', None) or 'job'}.{getattr(fn, '__qualname__', description)}"
+
+        def run():
+            try:
+                with instrumentation.operation(name):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                self.call_soon(self.finish, on_error, e, True)
+            else:
+                self.call_soon(self.finish, on_done, result, False)
+
+        self.pool.submit(run)
+        self.start_polling()
+
+    def call_soon(self, fn, *args):
+        # Safe from any thread: fn(*args) runs on the Tk thread
+        self.callbacks.put((fn, args))
+
+    def finish(self, callback, value, failed):
+        self.pending -= 1
+        if self.pending == 0:
+            self.status_var.set("Ready")
+        if callback is not None:
+            callback(value)
+        elif failed:
+            # Nobody asked for this error, don't let it vanish silently
+            self.root.report_callback_exception(type(value), value, value.__traceback__)
+
+    def start_polling(self):
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        try:
+            while True:
+                try:
+                    fn, args = self.callbacks.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fn(*args)
+                except Exception:
+                    # A failing callback is reported like any other Tk
+                    # callback error, and the jobs queued after it still run
+                    self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            if self.pending > 0 or not self.callbacks.empty():
+                self.root.after(self.POLL_MS, self.poll)
+            else:
+                self.polling = False
+
+    def shutdown(self):
+        # Let queued writes finish before the database is closed
+        self.pool.shutdown(wait=True)
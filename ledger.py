@@ -0,0 +1,18 @@
+# Stock movement ledger. Every change to stock is appended to stock_movements
+# (never updated or deleted) inside the same transaction that updates the
+# current stock in inventory, so the two can't drift apart. Date ranges of it
+# are read by export.py's movements dataset, through the created_at index,
+# and the sales rollups are kept from it by a trigger (Databases.py).
+
+RECEIPT = "receipt"
+ISSUE = "issue"
+RETURN = "return"
+ADJUSTMENT = "adjustment"
+
+def record_movement(cursor, product_id, product, kind, quantity, price_per_kg=None, salesman=None, salesman_record_id=None):
+    # quantity is the signed change to stock: negative for issues
+    cursor.execute("""
+        INSERT INTO stock_movements (product_id, product, kind, quantity, price_per_kg, salesman, salesman_record_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (product_id, product.lower(), kind, quantity, price_per_kg, salesman, salesman_record_id))
+    return cursor.lastrowid
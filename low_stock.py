@@ -0,0 +1,60 @@
+import tkinter as tk
+from bisect import bisect_left
+from tkinter import ttk
+import instrumentation
+from services import list_low_stock
+
+# Products whose stock has fallen below their reorder level.
+# The panel loads the list once through the idx_inventory_low_stock partial
+# index; after that only the products named in each inventory change event
+# are checked again.
+
+class LowStockPanel:
+    def __init__(self, parent, db):
+        self.db = db
+
+        self.frame = tk.LabelFrame(parent, text="Low Stock", bg="#ffffff", fg="#d32f2f")
+        self.tree = ttk.Treeview(self.frame, columns=("ID", "Name", "Quantity", "Reorder Level"), show="headings", height=5)
+        for col, width in (("ID", 40), ("Name", 120), ("Quantity", 70), ("Reorder Level", 90)):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, anchor="center", width=width)
+        # Products that dropped below their level since the panel was loaded
+        self.tree.tag_configure("new", background="#ffcdd2")
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        # Filled by reload() once the window is up
+        self.db.subscribe("inventory", self.refresh_items)
+
+    def reload(self, rows=None):
+        # rows: list_low_stock() already read on the worker, or None to read it now
+        self.tree.delete(*self.tree.get_children())
+        for row in rows if rows is not None else list_low_stock(self.db):
+            self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+        self.update_title()
+
+    def refresh_items(self, ids):
+        # Re-check only the products that just changed
+        if not ids:
+            return
+        with instrumentation.operation("low_stock.refresh_items"):
+            self.patch_items(ids)
+
+    def patch_items(self, ids):
+        ids = {int(item_id) for item_id in ids}
+        low = {row[0]: row for row in list_low_stock(self.db, ids)}
+
+        for item_id in sorted(ids):
+            iid = str(item_id)
+            if item_id in low:
+                if self.tree.exists(iid):
+                    self.tree.item(iid, values=low[item_id])
+                else:
+                    children = [int(child) for child in self.tree.get_children()]
+                    self.tree.insert("", bisect_left(children, item_id), iid=iid, values=low[item_id], tags=("new",))
+            elif self.tree.exists(iid):
+                self.tree.delete(iid)
+        self.update_title()
+
+    def update_title(self):
+        count = len(self.tree.get_children())
+        self.frame.configure(text=f"Low Stock ({count})" if count else "Low Stock")
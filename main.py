@@ -1,23 +1,61 @@
+import time
+STARTED = time.perf_counter()  # before the imports below, so they count towards startup time
+
+import argparse
 import tkinter as tk
 from tkinter import ttk
 from ui_components import InventoryApp
-from Databases import create_db, create_salesman_db
+from Databases import setup_databases
+from data_access import ConnectionManager
+import instrumentation
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventory and Salesman Management")
+    parser.add_argument("--instrument", action="store_true",
+                        help="time database, table and report operations (Stats button next to the status bar)")
+    parser.add_argument("--metrics-log", default=instrumentation.DEFAULT_LOG,
+                        help="JSON lines file the measurements are appended to (default: %(default)s)")
+    parser.add_argument("--profile", metavar="OPERATION",
+                        help="run the first OPERATION (e.g. services.issue_stock) under cProfile; implies --instrument")
+    args = parser.parse_args(argv)
+
+    if args.instrument or args.profile:
+        instrumentation.enable(args.metrics_log)
+    if args.profile:
+        instrumentation.profile_next(args.profile)
 
-def main():
     # Initialize main window
     root = tk.Tk()
     root.title("Inventory and Salesman Management")
     root.geometry("800x600")
 
-    # Set up the databases
-    create_db()
-    create_salesman_db()
+    # Set up the databases (a single version check once they are up to date)
+    setup_databases()
+
+    # Open the shared database connections
+    db = ConnectionManager()
 
-    # Create the InventoryApp
-    app = InventoryApp(root)
+    # Create the InventoryApp, then draw the window before loading any rows
+    app = InventoryApp(root, db)
+    root.update()
+    shown = time.perf_counter()
+    app.load_data(on_done=lambda: report_startup(shown - STARTED, time.perf_counter() - STARTED))
+
+    # Close the connections cleanly when the window is closed
+    def on_close():
+        app.jobs.shutdown()
+        db.close()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
 
     # Run the application
     root.mainloop()
 
+def report_startup(shown, loaded):
+    print(f"Window shown in {shown * 1000:.0f} ms, first rows loaded in {loaded * 1000:.0f} ms")
+    instrumentation.record_timing("startup.window_shown", shown * 1000)
+    instrumentation.record_timing("startup.data_loaded", loaded * 1000)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+import tkinter as tk
+from bisect import bisect_left
+import instrumentation
+
+class PagedTable:
+    # Shows a database table in a Treeview without loading all of it.
+    # Only a window of a few pages is kept in the tree; more rows are fetched
+    # with keyset pagination on id as the user scrolls towards either end.
+    def __init__(self, tree, scrollbar, db, table, columns, page_size=100, max_pages=3):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+        self.first_id = None
+        self.last_id = None
+        self.at_start = True
+        self.at_end = True
+        self.check_pending = False
+        # Only rows matching this condition are shown, see set_filter
+        self.where = "1"
+        self.where_params = ()
+
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.db.subscribe(self.table, self.refresh_rows)
+
+    def select(self, where, params, order, limit):
+        return self.db.query(
+            f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE ({self.where}) AND {where} ORDER BY id {order} LIMIT ?",
+            self.where_params + params + (limit,),
+        )
+
+    def set_filter(self, where="1", params=()):
+        # Show only the rows matching where (e.g. a search box) from the top
+        self.where = where
+        self.where_params = tuple(params)
+        self.reload()
+
+    def first_page(self):
+        # The rows reload() starts with; only reads, so it can run on a worker thread
+        return self.select("1", (), "ASC", self.page_size)
+
+    def reload(self, rows=None):
+        # Start again from the top of the table, from rows when the first
+        # page was already fetched with first_page()
+        self.tree.delete(*self.tree.get_children())
+        self.first_id = None
+        self.last_id = None
+        self.at_start = True
+        self.at_end = False
+        self.load_next(rows)
+
+    def load_next(self, rows=None):
+        with instrumentation.operation(f"{self.table}.load_next"):
+            self.append_page(rows)
+
+    def append_page(self, rows=None):
+        top_index = self.top_index()
+        if rows is None and self.last_id is None:
+            rows = self.first_page()
+        elif rows is None:
+            rows = self.select("id > ?", (self.last_id,), "ASC", self.page_size)
+
+        with instrumentation.timer("tree_insert_ms"):
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+        self.at_end = len(rows) < self.page_size
+
+        # Drop pages from the top once the window gets too big
+        excess = len(self.tree.get_children()) - self.page_size * self.max_pages
+        if excess > 0:
+            self.trim(0, excess)
+            self.at_start = False
+            self.scroll_to(top_index - excess)
+        self.update_bounds()
+
+    def load_previous(self):
+        with instrumentation.operation(f"{self.table}.load_previous"):
+            self.prepend_page()
+
+    def prepend_page(self):
+        top_index = self.top_index()
+        rows = self.select("id < ?", (self.first_id,), "DESC", self.page_size)
+
+        with instrumentation.timer("tree_insert_ms"):
+            for row in rows:
+                self.tree.insert("", 0, iid=str(row[0]), values=row)
+        self.at_start = len(rows) < self.page_size
+
+        # Drop pages from the bottom once the window gets too big
+        children = self.tree.get_children()
+        excess = len(children) - self.page_size * self.max_pages
+        if excess > 0:
+            self.trim(len(children) - excess, excess)
+            self.at_end = False
+
+        # Rows were added above, keep the same rows on screen
+        self.scroll_to(top_index + len(rows))
+        self.update_bounds()
+
+    def trim(self, start, count):
+        children = self.tree.get_children()
+        self.tree.delete(*children[start:start + count])
+
+    def update_bounds(self):
+        children = self.tree.get_children()
+        if children:
+            self.first_id = int(children[0])
+            self.last_id = int(children[-1])
+
+    def top_index(self):
+        top, _ = self.tree.yview()
+        return int(round(top * len(self.tree.get_children())))
+
+    def scroll_to(self, index):
+        count = len(self.tree.get_children())
+        if count:
+            self.tree.yview_moveto(max(index, 0) / count)
+
+    def refresh_rows(self, ids):
+        # Patch only the rows that changed in the database
+        if not ids:
+            return
+        with instrumentation.operation(f"{self.table}.refresh_rows"):
+            self.patch_rows(ids)
+
+    def patch_rows(self, ids):
+        ids = [int(item_id) for item_id in ids]
+        placeholders = ", ".join("?" for _ in ids)
+        rows = self.select(f"id IN ({placeholders})", tuple(ids), "ASC", len(ids))
+        found = {row[0] for row in rows}
+
+        for row in rows:
+            iid = str(row[0])
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=row)
+            elif self.in_window(row[0]):
+                children = [int(child) for child in self.tree.get_children()]
+                self.tree.insert("", bisect_left(children, row[0]), iid=iid, values=row)
+
+        for item_id in ids:
+            iid = str(item_id)
+            if item_id not in found and self.tree.exists(iid):
+                self.tree.delete(iid)
+        self.update_bounds()
+
+    def in_window(self, item_id):
+        # Rows beyond the loaded pages are picked up when scrolled to
+        if self.first_id is None:
+            return self.at_start and self.at_end
+        if item_id > self.last_id:
+            return self.at_end
+        if item_id < self.first_id:
+            return self.at_start
+        return True
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Fetch outside of the scroll callback, Tk may call it again while we insert
+        if not self.check_pending:
+            self.check_pending = True
+            self.tree.after_idle(self.check_window)
+
+    def check_window(self):
+        self.check_pending = False
+        first, last = self.tree.yview()
+        if last >= 0.9 and not self.at_end:
+            self.load_next()
+        elif first <= 0.1 and not self.at_start:
+            self.load_previous()
@@ -1,133 +1,303 @@
+import hashlib
 import os
+import re
 import sqlite3
-from datetime import datetime
-from fpdf import FPDF
-import tkinter as tk
-from tkinter import messagebox
-
-def generate_salesman_reports():
-    # Initialize tkinter (hidden root window for dialog boxes)
-    root = tk.Tk()
-    root.withdraw()
-    # Get the current date and month
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    current_month = datetime.now().strftime("%B")  # Full name of the month (e.g., "January")
-
-    # Base folder for all salesman data
-    base_folder = "Salesman Data"
-
-    # Connect to the databases
-    conn_salesman = sqlite3.connect("salesman.db")
-    cursor_salesman = conn_salesman.cursor()
-    conn_inventory = sqlite3.connect("inventory.db")
-    cursor_inventory = conn_inventory.cursor()
-
-    # Fetch all salesman data (case-insensitive)
-    cursor_salesman.execute("SELECT DISTINCT name FROM salesman")
-    salesmen = cursor_salesman.fetchall()
-
-    for salesman in salesmen:
-        salesman_name = salesman[0].lower()  # Convert to lowercase for consistent comparison
-
-        # Create the folder path: Salesman Data/salesman_name/current_month
-        salesman_folder = os.path.join(base_folder, salesman_name, current_month)
-        if not os.path.exists(salesman_folder):
-            os.makedirs(salesman_folder)
-
-        # Path to the PDF file for the salesman
-        pdf_path = os.path.join(salesman_folder, f"{current_date}.pdf")
-
-        # Create PDF document
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-
-        # Set title
-        pdf.set_font("Arial", size=14, style='B')  # Reduced font size
-        pdf.cell(200, 10, txt=f"Sales Report for {salesman_name}", ln=True, align='C')
-
-        # Fetch all products handled by the salesman (case-insensitive comparison)
-        cursor_salesman.execute("""
-            SELECT product, quantity, payment, return
-            FROM salesman
-            WHERE LOWER(name) = ?
-        """, (salesman_name,))
-        transactions = cursor_salesman.fetchall()
-
-        product_data = {}
-        for transaction in transactions:
-            product, quantity, payment, return_qty = transaction
-
-            # Normalize the product name to lowercase for consistent comparison
-            product_normalized = product.lower()
-
-            if product_normalized not in product_data:
-                product_data[product_normalized] = {
-                    "issues": [],
-                    "total_returns": 0,
-                    "total_payment": 0
-                }
-
-            product_data[product_normalized]["issues"].append(quantity)
-            product_data[product_normalized]["total_returns"] += return_qty
-            product_data[product_normalized]["total_payment"] += payment
-        
-
-        # Generate table in the PDF
-        pdf.ln(10)
-        pdf.set_font("Arial", size=10, style='B')  # Reduced font size for the table headers
-
-        pdf.cell(35, 8, "Product", border=1, align='C')  # Reduced width
-        for i in range(1, len(max(product_data.values(), key=lambda x: len(x["issues"]))["issues"]) + 1):
-            pdf.cell(20, 8, f"Issue {i}", border=1, align='C')  # Reduced width
-        pdf.cell(20, 8, "T.Issues", border=1, align='C')  # Adjusted width
-        pdf.cell(20, 8, "Returns", border=1, align='C')  # Single column for total returns
-        pdf.cell(20, 8, "Rate", border=1, align='C')  # Rate column
-        pdf.cell(20, 8, "Sales", border=1, align='C')  # Sales column
-        pdf.cell(35, 8, "Total Payment", border=1, align='C')
-        pdf.ln()
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+import instrumentation
+from Databases import INVENTORY_DB
+from export import iter_rows
+from report_data import build_report_data, range_report_query, iter_period_reports, next_month
+from report_layout import PeriodReportWriter
+from report_snapshot import encode_report, report_digest, stored_digest, write_snapshot, replace_atomically
+
+# Base folder for all salesman data
+BASE_FOLDER = "Salesman Data"
+# Reports covering every salesman, under BASE_FOLDER
+CONSOLIDATED_FOLDER = "All Salesmen"
+
+# Digest of the data each report was last rendered from, keyed by PDF path.
+# The same digest is kept on disk in the report's snapshot (report_snapshot.py),
+# so unchanged reports are also skipped after a restart
+rendered_digests = {}
+
+# Report engine: gathers the data, renders the PDFs and returns what happened.
+# It never touches Tk, showing errors is up to the caller, and fpdf is only
+# imported once a report is actually rendered.
+
+def generate_salesman_reports(db=None, progress=None, salesmen=None, base_folder=BASE_FOLDER, force=False):
+    # salesmen limits the run to those names (the ones whose data changed);
+    # by default every salesman is considered. Reports whose data hasn't
+    # changed since they were last rendered are skipped unless force is set.
+    # Returns (written, errors): the PDF paths saved and a list of
+    # (salesman, pdf_path, error message) for reports that could not be saved
+    # Reports are filed under the current date
+    now = datetime.now()
+
+    # Fetch every report's figures in one go (case-insensitive)
+    reports = fetch_reports(db, lambda fetch: build_report_data(fetch, salesmen))
+
+    # Path to the PDF file for the salesman: Salesman Data/salesman_name/current_month/current_date.pdf
+    return write_reports(reports, lambda salesman_name: report_path(base_folder, salesman_name, now), progress, force=force)
+
+def generate_monthly_reports(db=None, month=None, progress=None, salesmen=None, base_folder=BASE_FOLDER, force=False):
+    # Month-end reports: each salesman's totals per product for month
+    # ('YYYY-MM', the current month by default), read from the monthly rollup,
+    # plus one document covering every salesman.
+    # Returns (written, errors) like generate_salesman_reports
+    when = datetime.strptime(month, "%Y-%m") if month else datetime.now()
+    start = when.strftime("%Y-%m-01")
+    return write_period_reports(
+        db, start, next_month(start), "Monthly Sales Report", f"{when:%B %Y}",
+        lambda salesman_name: monthly_report_path(base_folder, salesman_name, when),
+        os.path.join(base_folder, CONSOLIDATED_FOLDER, f"{when:%Y-%m} monthly.pdf"),
+        progress, salesmen, force)
+
+def generate_range_reports(db=None, start=None, end=None, progress=None, salesmen=None, base_folder=BASE_FOLDER, force=False):
+    # Reports for the days start <= day < end ('YYYY-MM-DD'), per salesman and
+    # consolidated, like generate_monthly_reports. Whole months in the range
+    # are read from the monthly rollup and the rest from the daily one
+    last_day = (datetime.strptime(end, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    label = start if last_day == start else f"{start} to {last_day}"
+    return write_period_reports(
+        db, start, end, "Sales Report", label,
+        lambda salesman_name: range_report_path(base_folder, salesman_name, label),
+        os.path.join(base_folder, CONSOLIDATED_FOLDER, f"{label}.pdf"),
+        progress, salesmen, force)
 
-        # Populate table rows
-        pdf.set_font("Arial", size=10)  # Reduced font size for the table rows
-        for product, details in product_data.items():
-            pdf.cell(35, 8, product, border=1, align='C')  # Adjusted width for the Product column
+def write_period_reports(db, start, end, title, subtitle, path_for, consolidated_path, progress=None, salesmen=None, force=False):
+    # Streams each salesman's totals for the range out of SQLite a batch at a
+    # time and writes them to the salesman's own report (skipped when its
+    # snapshot is current) and to the consolidated document as it goes, so
+    # memory doesn't grow with the length of the range.
+    # Returns (written, errors)
+    written = []
+    errors = []
+    sql, params = range_report_query(start, end, salesmen)
+    # A connection of our own, so the stream doesn't hold the app's connection
+    conn = sqlite3.connect(db.path if db is not None else INVENTORY_DB)
+    try:
+        total, consolidated_body, consolidated_digest = scan_range(conn, sql, params, title, subtitle)
+        if not total:
+            return written, errors
 
-            total_issues = 0
-            for issue_qty in details["issues"]:
-                total_issues += issue_qty
-                pdf.cell(20, 8, str(issue_qty), border=1, align='C')  # Adjusted width for Issue columns
+        # The consolidated report is only rendered again when its figures changed
+        consolidated = None
+        if force or not is_current(consolidated_path, consolidated_digest):
+            try:
+                consolidated = PeriodReportWriter(title, subtitle)
+            except Exception as e:
+                errors.append((CONSOLIDATED_FOLDER, consolidated_path, f"Error saving report for all salesmen at {consolidated_path}: {e}"))
+        issued = returned = payment = 0
 
-            for _ in range(len(details["issues"]), len(max(product_data.values(), key=lambda x: len(x["issues"]))["issues"])):
-                pdf.cell(20, 8, "", border=1, align='C')  # Empty cells for missing issues
+        rows = chain.from_iterable(iter_rows(conn, sql, params))
+        for done, (salesman_name, product_data, rates) in enumerate(iter_period_reports(rows)):
+            if progress is not None:
+                progress(done, total)
+            if consolidated is not None:
+                section = consolidated.add_salesman(salesman_name, product_data, rates)
+                issued, returned, payment = issued + section[0], returned + section[1], payment + section[2]
 
-            pdf.cell(20, 8, str(total_issues), border=1, align='C')  # Total issues column
+            pdf_path = path_for(salesman_name)
+            salesman_title = f"{title} for {salesman_name}"
+            body = encode_report(f"{salesman_title} ({subtitle})", product_data, rates)
+            digest = report_digest(body)
+            if not force and is_current(pdf_path, digest):
+                continue
+            try:
+                with instrumentation.operation("report.period"):
+                    writer = PeriodReportWriter(salesman_title, subtitle)
+                    writer.add_salesman(salesman_name, product_data, rates)
+                    replace_atomically(pdf_path, writer.output)
+                    write_snapshot(pdf_path, body, digest)
+                rendered_digests[pdf_path] = digest
+                written.append(pdf_path)
+                print(f"Salesman report for {salesman_name} saved at {pdf_path}")
+            except Exception as e:
+                error_message = f"Error saving report for {salesman_name} at {pdf_path}: {e}"
+                print(error_message)
+                errors.append((salesman_name, pdf_path, error_message))
 
-            pdf.cell(20, 8, str(details["total_returns"]), border=1, align='C')  # Total returns column
+        if consolidated is not None:
+            try:
+                with instrumentation.operation("report.consolidated"):
+                    consolidated.add_grand_total(total, issued, returned, payment)
+                    replace_atomically(consolidated_path, consolidated.output)
+                    write_snapshot(consolidated_path, consolidated_body, consolidated_digest)
+                rendered_digests[consolidated_path] = consolidated_digest
+                written.append(consolidated_path)
+                print(f"Report for all salesmen saved at {consolidated_path}")
+            except Exception as e:
+                error_message = f"Error saving report for all salesmen at {consolidated_path}: {e}"
+                print(error_message)
+                errors.append((CONSOLIDATED_FOLDER, consolidated_path, error_message))
+    finally:
+        conn.close()
 
-            # Fetch rate from inventory
-            cursor_inventory.execute("SELECT price_per_kg FROM inventory WHERE LOWER(name) = LOWER(?)", (product,))
-            result = cursor_inventory.fetchone()
-            rate = f"Rs.{result[0]:.2f}" if result else "N/A"
-            pdf.cell(20, 8, rate, border=1, align='C')  # Rate column
+    if progress is not None:
+        progress(total, total)
+    return written, errors
 
-            # Calculate sales
-            sales = total_issues - details["total_returns"]
-            pdf.cell(20, 8, str(sales), border=1, align='C')  # Sales column
+def scan_range(conn, sql, params, title, subtitle):
+    # One pass over the range's rows before anything is rendered. Returns how
+    # many salesmen they cover, and the body and digest for the consolidated
+    # report's snapshot: the body holds just its title, as the whole table
+    # would grow with the range, and the digest covers every row as well
+    body = encode_report(f"{title} ({subtitle})", {}, {})
+    digest = hashlib.sha1(body)
+    salesmen = 0
+    previous = None
+    for rows in iter_rows(conn, sql, params):
+        for row in rows:
+            if row[0] != previous:
+                salesmen += 1
+                previous = row[0]
+            digest.update(repr(row).encode("utf-8"))
+    return salesmen, body, digest.digest()
 
-            adjusted_payment = details["total_payment"] if result else 0
-            pdf.cell(35, 8, f"Rs.{adjusted_payment:.2f}", border=1, align='C')  # Adjusted width
-            pdf.ln()
+def fetch_reports(db, build):
+    # Runs build(fetch) on the app's shared connection when given, otherwise on our own
+    if db is not None:
+        return build(db.query)
+    conn = sqlite3.connect(INVENTORY_DB)
+    try:
+        return build(lambda sql, params=(): conn.execute(sql, params).fetchall())
+    finally:
+        conn.close()
+
+def write_reports(reports, path_for, progress=None, force=False):
+    # Renders {salesman: (product_data, rates)} to path_for(salesman), each
+    # with its snapshot. Returns (written, errors)
+    written = []
+    errors = []
+    for done, (salesman_name, (product_data, rates)) in enumerate(reports.items()):
+        if progress is not None:
+            progress(done, len(reports))
+
+        pdf_path = path_for(salesman_name)
+
+        # Skip the report if it was already rendered from the same data
+        title = default_title(salesman_name)
+        body = encode_report(title, product_data, rates)
+        digest = report_digest(body)
+        if not force and is_current(pdf_path, digest):
+            continue
 
         try:
-            # Save the PDF
-            pdf.output(pdf_path)
+            # Save the PDF, then the snapshot that vouches for it
+            with instrumentation.operation("report.salesman"):
+                render_salesman_report(salesman_name, product_data, rates, pdf_path, title)
+                write_snapshot(pdf_path, body, digest)
+            rendered_digests[pdf_path] = digest
+            written.append(pdf_path)
             print(f"Salesman report for {salesman_name} saved at {pdf_path}")
-        except OSError as e:
+        except Exception as e:
             error_message = f"Error saving report for {salesman_name} at {pdf_path}: {e}"
             print(error_message)  # Log to console
-            messagebox.showerror("File Save Error", error_message)  # Show error dialog
+            errors.append((salesman_name, pdf_path, error_message))
+
+    if progress is not None:
+        progress(len(reports), len(reports))
+
+    return written, errors
+
+def is_current(pdf_path, digest):
+    # Whether pdf_path exists and was rendered from data with this digest
+    if rendered_digests.get(pdf_path) != digest:
+        if stored_digest(pdf_path) != digest:
+            return False
+        rendered_digests[pdf_path] = digest
+    return os.path.exists(pdf_path)
+
+def default_title(salesman_name):
+    return f"Sales Report for {salesman_name}"
+
+def report_path(base_folder, salesman_name, when):
+    # Salesman Data/<name>/<Month>/<YYYY-MM-DD>.pdf
+    current_date = when.strftime("%Y-%m-%d")
+    current_month = when.strftime("%B")  # Full name of the month (e.g., "January")
+    return os.path.join(base_folder, salesman_folder(salesman_name), current_month, f"{current_date}.pdf")
+
+def monthly_report_path(base_folder, salesman_name, when):
+    # Salesman Data/<name>/<Month>/<YYYY-MM> monthly.pdf, next to that month's daily reports
+    return os.path.join(base_folder, salesman_folder(salesman_name), when.strftime("%B"), f"{when:%Y-%m} monthly.pdf")
+
+def range_report_path(base_folder, salesman_name, label):
+    # Salesman Data/<name>/Ranges/<YYYY-MM-DD to YYYY-MM-DD>.pdf
+    return os.path.join(base_folder, salesman_folder(salesman_name), "Ranges", f"{label}.pdf")
+
+def salesman_folder(salesman_name):
+    # The name as a single folder inside base_folder: names recorded before
+    # issue_many checked them may hold separators, a drive or be "..", which
+    # os.path.join would follow out of the folder
+    folder = re.sub(r"[/\\:]", "_", salesman_name)
+    return "_" if folder in ("", ".", "..") else folder
+
+# Renders one salesman's report table to pdf_path. Module level and free of
+# database/Tk access so it can also run in a worker process
+def render_salesman_report(salesman_name, product_data, rates, pdf_path, title=None):
+    from fpdf import FPDF
+
+    # Create PDF document
+    started = time.perf_counter()
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # Set title
+    pdf.set_font("Arial", size=14, style='B')  # Reduced font size
+    pdf.cell(200, 10, txt=title or default_title(salesman_name), ln=True, align='C')
+
+    # Generate table in the PDF
+    pdf.ln(10)
+    pdf.set_font("Arial", size=10, style='B')  # Reduced font size for the table headers
+
+    # Number of issue columns, the most issues of any product
+    max_issues = max(len(details["issues"]) for details in product_data.values())
+
+    pdf.cell(35, 8, "Product", border=1, align='C')  # Reduced width
+    for i in range(1, max_issues + 1):
+        pdf.cell(20, 8, f"Issue {i}", border=1, align='C')  # Reduced width
+    pdf.cell(20, 8, "T.Issues", border=1, align='C')  # Adjusted width
+    pdf.cell(20, 8, "Returns", border=1, align='C')  # Single column for total returns
+    pdf.cell(20, 8, "Rate", border=1, align='C')  # Rate column
+    pdf.cell(20, 8, "Sales", border=1, align='C')  # Sales column
+    pdf.cell(35, 8, "Total Payment", border=1, align='C')
+    pdf.ln()
+
+    # Populate table rows
+    pdf.set_font("Arial", size=10)  # Reduced font size for the table rows
+    for product, details in product_data.items():
+        pdf.cell(35, 8, product, border=1, align='C')  # Adjusted width for the Product column
+
+        total_issues = 0
+        for issue_qty in details["issues"]:
+            total_issues += issue_qty
+            pdf.cell(20, 8, str(issue_qty), border=1, align='C')  # Adjusted width for Issue columns
+
+        for _ in range(len(details["issues"]), max_issues):
+            pdf.cell(20, 8, "", border=1, align='C')  # Empty cells for missing issues
+
+        pdf.cell(20, 8, str(total_issues), border=1, align='C')  # Total issues column
+
+        pdf.cell(20, 8, str(details["total_returns"]), border=1, align='C')  # Total returns column
+
+        result = rates[product]
+        rate = f"Rs.{result:.2f}" if result is not None else "N/A"
+        pdf.cell(20, 8, rate, border=1, align='C')  # Rate column
+
+        # Calculate sales
+        sales = total_issues - details["total_returns"]
+        pdf.cell(20, 8, str(sales), border=1, align='C')  # Sales column
+
+        adjusted_payment = details["total_payment"] if result is not None else 0
+        pdf.cell(35, 8, f"Rs.{adjusted_payment:.2f}", border=1, align='C')  # Adjusted width
+        pdf.ln()
 
+    instrumentation.note("render_ms", (time.perf_counter() - started) * 1000)
 
-    # Close the database connections
-    conn_salesman.close()
-    conn_inventory.close()
\ No newline at end of file
+    # Save the PDF under a temporary name and rename it into place, so anyone
+    # opening the report never sees it half written
+    with instrumentation.timer("write_ms"):
+        replace_atomically(pdf_path, pdf.output)
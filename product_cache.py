@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+
+# Process-wide cache of the product catalog, keyed on the lowercased name, so
+# resolving a product on the sales hot path doesn't need a query. Every
+# mutation writes its new values through to the cache; the database stays the
+# authority (stock is still checked by the conditional UPDATE).
+
+class ProductEntry:
+    __slots__ = ("id", "name", "quantity", "price_per_kg")
+
+    def __init__(self, id, name, quantity, price_per_kg):
+        self.id = id
+        self.name = name
+        self.quantity = quantity
+        self.price_per_kg = price_per_kg
+
+class ProductCache:
+    SELECT = "SELECT id, LOWER(name), quantity, price_per_kg FROM inventory"
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, fetch):
+        # Fill the cache, up to max_size products. The app does this on the
+        # background worker after startup, so products written through in the
+        # meantime are newer than the rows read here and are kept
+        rows = fetch(f"{self.SELECT} ORDER BY id LIMIT ?", (self.max_size,))
+        with self.lock:
+            for row in rows:
+                if len(self.entries) >= self.max_size:
+                    break
+                if row[1] not in self.entries:
+                    self.entries[row[1]] = ProductEntry(*row)
+
+    def get(self, name, fetch=None):
+        # Returns the entry for name, or None. On a miss the product is looked
+        # up with fetch (when given) and cached
+        key = name.strip().lower()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            self.misses += 1
+        if fetch is None:
+            return None
+        rows = fetch(f"{self.SELECT} WHERE LOWER(name) = ?", (key,))
+        if not rows:
+            return None
+        return self.put(*rows[0])
+
+    def put(self, id, name, quantity, price_per_kg):
+        key = name.strip().lower()
+        entry = ProductEntry(id, key, quantity, price_per_kg)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def remove(self, name):
+        with self.lock:
+            self.entries.pop(name.strip().lower(), None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from Databases import INVENTORY_DB, setup_databases
+from data_access import ConnectionManager
+from pdf_generator import BASE_FOLDER, report_path, render_salesman_report, default_title
+from pdf_generator import generate_monthly_reports, generate_range_reports
+from report_snapshot import encode_report, report_digest, stored_digest, write_snapshot
+from report_data import build_report_data
+
+# Headless end-of-day report run: every salesman's PDF is rendered in a pool
+# of worker processes without starting Tk. Reports whose snapshot shows they
+# were already rendered from the same data are left as they are.
+#
+#   python report_batch.py --workers 8
+#   python report_batch.py --month 2025-01                       # month-end reports
+#   python report_batch.py --start 2025-01-01 --end 2025-04-01   # any range of days
+#
+# Month and range reports also include one document covering every salesman,
+# under Salesman Data/All Salesmen.
+
+def fetch_all_report_data(db_path=INVENTORY_DB):
+    # One query for every salesman's transactions together with the product rates
+    conn = sqlite3.connect(db_path)
+    try:
+        return build_report_data(lambda sql, params=(): conn.execute(sql, params).fetchall())
+    finally:
+        conn.close()
+
+def render_task(salesman_name, product_data, rates, pdf_path, body, digest):
+    # Runs in a worker process
+    start = time.perf_counter()
+    render_salesman_report(salesman_name, product_data, rates, pdf_path)
+    write_snapshot(pdf_path, body, digest)
+    return time.perf_counter() - start
+
+def run_batch(db_path=INVENTORY_DB, base_folder=BASE_FOLDER, workers=None, when=None, force=False):
+    # Returns (written, failures): lists of (salesman, pdf_path, seconds) and (salesman, pdf_path, error)
+    when = when or datetime.now()
+
+    start = time.perf_counter()
+    reports = fetch_all_report_data(db_path)
+    print(f"Fetched data for {len(reports)} salesmen in {time.perf_counter() - start:.3f}s")
+
+    written = []
+    failures = []
+    unchanged = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for salesman_name, (product_data, rates) in reports.items():
+            pdf_path = report_path(base_folder, salesman_name, when)
+            body = encode_report(default_title(salesman_name), product_data, rates)
+            digest = report_digest(body)
+            if not force and stored_digest(pdf_path) == digest and os.path.exists(pdf_path):
+                unchanged += 1
+                continue
+            future = pool.submit(render_task, salesman_name, product_data, rates, pdf_path, body, digest)
+            futures[future] = (salesman_name, pdf_path)
+
+        for future in as_completed(futures):
+            salesman_name, pdf_path = futures[future]
+            try:
+                seconds = future.result()
+            except Exception as e:
+                failures.append((salesman_name, pdf_path, e))
+                print(f"FAILED {salesman_name}: {e}")
+            else:
+                written.append((salesman_name, pdf_path, seconds))
+                print(f"{salesman_name}: {pdf_path} ({seconds:.3f}s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(written)} reports in {elapsed:.3f}s, {len(failures)} failed, {unchanged} unchanged")
+    return written, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every salesman's PDF report without the GUI.")
+    parser.add_argument("--db", default=INVENTORY_DB, help="database file (default: %(default)s)")
+    parser.add_argument("--output", default=BASE_FOLDER, help="base report folder (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--date", type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+                        help="file the reports under this date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--force", action="store_true", help="render every report, even those whose data hasn't changed")
+    parser.add_argument("--month", help="month-end reports for this month, YYYY-MM, instead of the daily ones")
+    parser.add_argument("--start", help="reports for the days from this one, YYYY-MM-DD (with --end)")
+    parser.add_argument("--end", help="up to but not including this day, YYYY-MM-DD (default: tomorrow)")
+    args = parser.parse_args(argv)
+
+    setup_databases(args.db)
+    if args.month or args.start:
+        db = ConnectionManager(args.db)
+        start = time.perf_counter()
+        try:
+            if args.month:
+                written, failures = generate_monthly_reports(db, args.month, base_folder=args.output, force=args.force)
+            else:
+                end = args.end or (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+                written, failures = generate_range_reports(db, args.start, end, base_folder=args.output, force=args.force)
+        finally:
+            db.close()
+        print(f"Saved {len(written)} reports in {time.perf_counter() - start:.3f}s, {len(failures)} failed")
+    else:
+        _, failures = run_batch(args.db, args.output, args.workers, args.date, args.force)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+from itertools import groupby
+from operator import itemgetter
+
+# Builds the per-salesman, per-product figures the reports are made of.
+# Everything comes from one query over the sales and one for the prices, so
+# the cost no longer grows with one query per salesman plus one per product row.
+
+RATE_LOOKUP_SIZE = 500  # product names per price query, under SQLite's variable limit
+
+def build_report_data(fetch, salesmen=None):
+    # fetch(sql, params) -> list of rows, e.g. ConnectionManager.query.
+    # Returns {salesman: (product_data, rates)} where product_data maps each
+    # product to its issues, total_returns and total_payment and rates maps it
+    # to price_per_kg (None when the product is no longer in the inventory).
+    # Salesmen and products are lowercased and kept in order of first sale.
+    where = ""
+    params = ()
+    if salesmen is not None:
+        salesmen = sorted({name.lower() for name in salesmen})
+        if not salesmen:
+            return {}
+        where = f"WHERE LOWER(name) IN ({', '.join('?' for _ in salesmen)})"
+        params = tuple(salesmen)
+
+    # Totalled here rather than with GROUP BY: SQLite doesn't promise the
+    # order group_concat sees a group's rows in, and the issues have to stay
+    # in the order they were made. Reading in id order keeps them so
+    rows = fetch(f"""
+        SELECT LOWER(name), LOWER(product), quantity, COALESCE(return, 0), COALESCE(payment, 0)
+        FROM salesman {where}
+        ORDER BY id
+    """, params)
+
+    sales = {}
+    for salesman_name, product, quantity, returned, payment in rows:
+        product_data = sales.setdefault(salesman_name, {})
+        details = product_data.get(product)
+        if details is None:
+            details = product_data[product] = {"issues": [], "total_returns": 0, "total_payment": 0}
+        details["issues"].append(quantity)
+        details["total_returns"] += returned
+        details["total_payment"] += payment
+
+    products = sorted({product for product_data in sales.values() for product in product_data})
+    prices = {}
+    for start in range(0, len(products), RATE_LOOKUP_SIZE):
+        chunk = products[start:start + RATE_LOOKUP_SIZE]
+        prices.update(fetch(f"""
+            SELECT LOWER(name), price_per_kg FROM inventory
+            WHERE LOWER(name) IN ({', '.join('?' for _ in chunk)})
+        """, tuple(chunk)))
+
+    return {salesman_name: (product_data, {product: prices.get(product) for product in product_data})
+            for salesman_name, product_data in sorted(sales.items())}
+
+# Rollup table and period column for each period, see Databases.add_sales_rollups
+ROLLUPS = {"day": ("sales_daily", "day"), "month": ("sales_monthly", "month")}
+
+def range_sources(start, end):
+    # Splits the days start <= day < end ('YYYY-MM-DD') into the rollup reads
+    # that cover them: whole months from sales_monthly and the days either
+    # side from sales_daily, so a year costs twelve monthly rows per product
+    # rather than 365 daily ones. Returns [(period, low, high)]
+    first_month = start if start.endswith("-01") else next_month(start)
+    last_month = end[:8] + "01"
+    if first_month >= last_month:
+        return [("day", start, end)]
+    sources = []
+    if start < first_month:
+        sources.append(("day", start, first_month))
+    sources.append(("month", first_month[:7], last_month[:7]))
+    if last_month < end:
+        sources.append(("day", last_month, end))
+    return sources
+
+def next_month(day):
+    # First day of the month after day's ('YYYY-MM-DD')
+    year, month = int(day[:4]), int(day[5:7])
+    return f"{year + month // 12}-{month % 12 + 1:02d}-01"
+
+def range_report_query(start, end, salesmen=None):
+    # SQL and params for every salesman's totals per product over the days
+    # start <= day < end, one row per salesman and product ordered by
+    # salesman: (salesman, product, issued, returned, payment, price_per_kg).
+    # SQLite does the grouping, so rows can be read a batch at a time
+    salesman_filter = ""
+    salesman_params = ()
+    if salesmen is not None:
+        salesmen = sorted({name.lower() for name in salesmen}) or [""]
+        salesman_filter = f" AND salesman IN ({', '.join('?' for _ in salesmen)})"
+        salesman_params = tuple(salesmen)
+
+    parts = []
+    params = ()
+    for period, low, high in range_sources(start, end):
+        table, column = ROLLUPS[period]
+        parts.append(f"""
+            SELECT salesman, product, issued, returned, payment FROM {table}
+            WHERE {column} >= ? AND {column} < ?{salesman_filter}
+        """)
+        params += (low, high) + salesman_params
+
+    # The unary + drops g.product's TEXT affinity, which would otherwise stop
+    # the join from using the LOWER(name) index
+    sql = f"""
+        SELECT g.salesman, g.product, g.issued, g.returned, g.payment, i.price_per_kg
+        FROM (
+            SELECT salesman, product, SUM(issued) AS issued, SUM(returned) AS returned, SUM(payment) AS payment
+            FROM ({" UNION ALL ".join(parts)})
+            GROUP BY salesman, product
+        ) g
+        LEFT JOIN inventory i ON LOWER(i.name) = +g.product
+        ORDER BY g.salesman, g.product
+    """
+    return sql, params
+
+def iter_period_reports(rows):
+    # Groups rows from range_report_query into (salesman, product_data, rates)
+    # one salesman at a time, in the shape build_report_data returns, so only
+    # the current salesman's products are held in memory
+    for salesman_name, group in groupby(rows, key=itemgetter(0)):
+        product_data = {}
+        rates = {}
+        for _, product, issued, returned, payment, rate in group:
+            product_data[product] = {
+                "issues": [issued],
+                "total_returns": returned,
+                "total_payment": payment
+            }
+            rates[product] = rate
+        yield salesman_name, product_data, rates
@@ -0,0 +1,121 @@
+# Paginated layout for period reports: one section per salesman, as many as
+# the data holds, in a single document. Columns are sized to the page width,
+# the table header is repeated at the top of every page a table runs onto,
+# sections start on a new page only when their heading and first rows won't
+# fit, and every page is numbered. Like render_salesman_report, fpdf is only
+# imported when a document is started.
+
+COLUMNS = (
+    # title, share of the page width, alignment
+    ("Product", 0.34, "L"),
+    ("Issued", 0.11, "R"),
+    ("Returns", 0.11, "R"),
+    ("Sales", 0.11, "R"),
+    ("Rate", 0.13, "R"),
+    ("Payment", 0.20, "R"),
+)
+ROW_HEIGHT = 7
+HEADING_HEIGHT = 10
+FOOTER_SPACE = 15
+
+class PeriodReportWriter:
+    def __init__(self, title, subtitle=""):
+        from fpdf import FPDF
+
+        self.title = title
+        self.subtitle = subtitle
+        self.pdf = FPDF()
+        self.pdf.alias_nb_pages()
+        # Page breaks are made here, between whole rows, rather than by fpdf
+        self.pdf.set_auto_page_break(False)
+        self.width = self.pdf.w - self.pdf.l_margin - self.pdf.r_margin
+        self.bottom = self.pdf.h - self.pdf.b_margin - FOOTER_SPACE
+        self.section = None
+        self.new_page()
+
+    def new_page(self):
+        pdf = self.pdf
+        pdf.add_page()
+
+        # Footer first, then back up to the top for the content
+        pdf.set_y(-FOOTER_SPACE)
+        pdf.set_font("Arial", size=8)
+        pdf.cell(self.width / 2, 8, f"{self.title} {self.subtitle}".strip(), 0, 0, "L")
+        pdf.cell(self.width / 2, 8, f"Page {pdf.page_no()} of {{nb}}", 0, 0, "R")
+        pdf.set_y(pdf.t_margin)
+
+        if pdf.page_no() == 1:
+            pdf.set_font("Arial", size=14, style="B")
+            pdf.cell(self.width, HEADING_HEIGHT, self.title, 0, 1, "C")
+            if self.subtitle:
+                pdf.set_font("Arial", size=10)
+                pdf.cell(self.width, 6, self.subtitle, 0, 1, "C")
+            pdf.ln(4)
+        elif self.section is not None:
+            # A table carried over from the previous page
+            self.section_heading(f"{self.section} (continued)")
+            self.table_header()
+
+    def ensure_space(self, height):
+        if self.pdf.get_y() + height > self.bottom:
+            self.new_page()
+
+    def section_heading(self, text):
+        self.pdf.set_font("Arial", size=12, style="B")
+        self.pdf.cell(self.width, HEADING_HEIGHT, text, 0, 1, "L")
+
+    def table_header(self):
+        self.pdf.set_font("Arial", size=10, style="B")
+        for title, share, _ in COLUMNS:
+            self.pdf.cell(self.width * share, ROW_HEIGHT, title, 1, 0, "C")
+        self.pdf.ln()
+
+    def row(self, values, bold=False):
+        self.ensure_space(ROW_HEIGHT)
+        self.pdf.set_font("Arial", size=10, style="B" if bold else "")
+        for (_, share, align), value in zip(COLUMNS, values):
+            self.pdf.cell(self.width * share, ROW_HEIGHT, self.fit(value, self.width * share), 1, 0, align)
+        self.pdf.ln()
+
+    def fit(self, text, width):
+        # Shortens text that would overflow its cell
+        text = str(text)
+        if self.pdf.get_string_width(text) <= width - 2:
+            return text
+        while text and self.pdf.get_string_width(text + "...") > width - 2:
+            text = text[:-1]
+        return text + "..."
+
+    def add_salesman(self, salesman_name, product_data, rates):
+        # One salesman's table and subtotal. Returns the section's totals
+        # (issued, returned, payment) for the grand total
+        self.ensure_space(HEADING_HEIGHT + 3 * ROW_HEIGHT)
+        self.section = salesman_name
+        self.section_heading(salesman_name)
+        self.table_header()
+
+        issued_total = returned_total = payment_total = 0
+        for product, details in product_data.items():
+            issued = sum(details["issues"])
+            returned = details["total_returns"]
+            rate = rates.get(product)
+            payment = details["total_payment"] if rate is not None else 0
+            self.row((product, issued, returned, issued - returned,
+                      f"Rs.{rate:.2f}" if rate is not None else "N/A", f"Rs.{payment:.2f}"))
+            issued_total += issued
+            returned_total += returned
+            payment_total += payment
+
+        self.row(("Total", issued_total, returned_total, issued_total - returned_total, "", f"Rs.{payment_total:.2f}"), bold=True)
+        self.section = None
+        self.pdf.ln(4)
+        return issued_total, returned_total, payment_total
+
+    def add_grand_total(self, salesmen, issued, returned, payment):
+        self.ensure_space(HEADING_HEIGHT + 2 * ROW_HEIGHT)
+        self.section_heading(f"All salesmen ({salesmen})")
+        self.table_header()
+        self.row(("Total", issued, returned, issued - returned, "", f"Rs.{payment:.2f}"), bold=True)
+
+    def output(self, path):
+        self.pdf.output(path)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import secrets
+import stat
+import struct
+
+# Snapshot of the figures a report PDF was rendered from, saved next to it as
+# <report>.pdf.snapshot. The header carries a SHA-1 of the encoded table, so
+# checking whether a report is current reads 25 bytes instead of rendering it
+# again; the rest is a compact copy of the table that read_snapshot() turns
+# back into (title, product_data, rates).
+#
+# Layout, little-endian:
+#   header   "RPTS", version (B), digest (20s)
+#   body     title, product count (I), then per product:
+#            name, issue count (I), issues, total_returns, total_payment, rate
+# Strings are a length (I) followed by UTF-8; every number is a type byte
+# (i int, d float, n None) and 8 bytes, so 5 and 5.0 digest differently,
+# as they print differently in the PDF.
+
+MAGIC = b"RPTS"
+VERSION = 1
+HEADER = struct.Struct("<4sB20s")
+COUNT = struct.Struct("<I")
+INT = struct.Struct("<cq")
+FLOAT = struct.Struct("<cd")
+SUFFIX = ".snapshot"
+
+def snapshot_path(pdf_path):
+    return pdf_path + SUFFIX
+
+def encode_report(title, product_data, rates):
+    # Returns the body bytes for a report's title and table
+    parts = [pack_text(title), COUNT.pack(len(product_data))]
+    for product, details in product_data.items():
+        parts.append(pack_text(product))
+        parts.append(COUNT.pack(len(details["issues"])))
+        parts.extend(pack_number(quantity) for quantity in details["issues"])
+        parts.append(pack_number(details["total_returns"]))
+        parts.append(pack_number(details["total_payment"]))
+        parts.append(pack_number(rates.get(product)))
+    return b"".join(parts)
+
+def report_digest(body):
+    return hashlib.sha1(body).digest()
+
+def stored_digest(pdf_path):
+    # Digest saved with the report, or None when there is no usable snapshot
+    try:
+        with open(snapshot_path(pdf_path), "rb") as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, digest = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return digest
+
+def write_snapshot(pdf_path, body, digest=None):
+    # Saves the snapshot once its PDF is in place, so a snapshot never
+    # vouches for a report that wasn't written
+    digest = digest or report_digest(body)
+    replace_atomically(snapshot_path(pdf_path), lambda path: write_bytes(path, HEADER.pack(MAGIC, VERSION, digest) + body))
+
+def read_snapshot(pdf_path):
+    # Returns (title, product_data, rates) as saved, or None
+    with open(snapshot_path(pdf_path), "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size or data[:4] != MAGIC or data[4] != VERSION:
+        return None
+    offset = HEADER.size
+    title, offset = unpack_text(data, offset)
+    count, offset = unpack_count(data, offset)
+    product_data = {}
+    rates = {}
+    for _ in range(count):
+        product, offset = unpack_text(data, offset)
+        issue_count, offset = unpack_count(data, offset)
+        issues = []
+        for _ in range(issue_count):
+            quantity, offset = unpack_number(data, offset)
+            issues.append(quantity)
+        total_returns, offset = unpack_number(data, offset)
+        total_payment, offset = unpack_number(data, offset)
+        rates[product], offset = unpack_number(data, offset)
+        product_data[product] = {"issues": issues, "total_returns": total_returns, "total_payment": total_payment}
+    return title, product_data, rates
+
+def replace_atomically(path, write):
+    # write(temp_path) fills a temporary file in the same folder, which then
+    # replaces path in one rename: readers see the old file or the new one,
+    # never half of it
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = create_temp(folder or ".", os.path.basename(path))
+    try:
+        write(temp_path)
+        # A report being replaced keeps its mode
+        if os.path.exists(path):
+            os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def create_temp(folder, name):
+    # An empty, new temporary file next to name. Created with mode 0o666 like
+    # open() does, so the umask applies (mkstemp would make it owner-only)
+    while True:
+        temp_path = os.path.join(folder, f".{name}.{secrets.token_hex(4)}.tmp")
+        try:
+            os.close(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            continue
+        return temp_path
+
+def write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def pack_text(text):
+    encoded = text.encode("utf-8")
+    return COUNT.pack(len(encoded)) + encoded
+
+def unpack_count(data, offset):
+    return COUNT.unpack_from(data, offset)[0], offset + COUNT.size
+
+def unpack_text(data, offset):
+    length, offset = unpack_count(data, offset)
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+def pack_number(value):
+    if value is None:
+        return INT.pack(b"n", 0)
+    if isinstance(value, int):
+        return INT.pack(b"i", value)
+    return FLOAT.pack(b"d", value)
+
+def unpack_number(data, offset):
+    kind = data[offset:offset + 1]
+    if kind == b"i":
+        return INT.unpack_from(data, offset)[1], offset + INT.size
+    if kind == b"d":
+        return FLOAT.unpack_from(data, offset)[1], offset + FLOAT.size
+    return None, offset + INT.size
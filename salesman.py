@@ -1,18 +1,36 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import sqlite3
-from pdf_generator import generate_salesman_reports
+from tkinter import ttk, messagebox, filedialog, simpledialog
+from datetime import datetime, timedelta
+from pdf_generator import generate_salesman_reports, generate_monthly_reports, generate_range_reports
+from paged_tree import PagedTable
+import instrumentation
+import services
+from services import SALESMAN_COLUMNS, ServiceError
+from bulk_import import import_issues
+from inventory import show_import_result
+from autocomplete import Autocomplete
 
 class SalesmanManager:
-    def __init__(self, root):
+    def __init__(self, root, db, jobs):
         self.root = root
+        self.db = db
+        self.jobs = jobs  # database and report work runs on the background worker
 
     def create_salesman_tab(self, notebook):
+        # The tab's widgets and records are only set up when it is first
+        # opened, see build_salesman_tab
         salesman_tab = tk.Frame(notebook, bg="#f0f0f0")
         notebook.add(salesman_tab, text="Salesman")
-        self.setup_salesman_tab(salesman_tab)
+        self.salesman_tab = salesman_tab
+        self.built = False
         return salesman_tab
 
+    def build_salesman_tab(self):
+        if not self.built:
+            self.built = True
+            with instrumentation.operation("salesman.build_tab"):
+                self.setup_salesman_tab(self.salesman_tab)
+
     # def setup_salesman_tab(self, tab):
     #     input_frame = tk.Frame(tab, padx=10, pady=10, bg="#ffffff", relief="groove")
     #     input_frame.pack(pady=10, fill=tk.X)
@@ -43,6 +61,7 @@ class SalesmanManager:
         self.salesman_product_var = tk.StringVar()
         self.salesman_product_entry = tk.Entry(input_frame, textvariable=self.salesman_product_var)
         self.salesman_product_entry.grid(row=1, column=1, padx=5, pady=5)
+        self.product_autocomplete = Autocomplete(self.salesman_product_entry, self.salesman_product_var, self.db.query)
 
         tk.Label(input_frame, text="Quantity", bg="#ffffff").grid(row=2, column=0, padx=5, pady=5)
         self.salesman_quantity_var = tk.IntVar()
@@ -58,27 +77,33 @@ class SalesmanManager:
         # Buttons
         tk.Button(input_frame, text="Add Salesman", command=self.add_salesman, bg="#4caf50", fg="white").grid(row=3, column=0, padx=5, pady=10)
         tk.Button(input_frame, text="View Salesmen", command=self.view_salesmen, bg="#2196f3", fg="white").grid(row=3, column=1, padx=5, pady=10)
-        tk.Button(input_frame, text="Save Salesmen data", command=generate_salesman_reports, bg="#FF0000", fg="white").grid(row=3, column=2, padx=15, pady=10)
+        tk.Button(input_frame, text="Save Salesmen data", command=self.save_reports, bg="#FF0000", fg="white").grid(row=3, column=2, padx=15, pady=10)
         tk.Button(input_frame, text="Clear Record", command=self.erase_all_data, bg="#000000", fg="white").grid(row=3, column=3, padx=15, pady=10)
+        tk.Button(input_frame, text="Import Issues", command=self.import_salesman_issues, bg="#9c27b0", fg="white").grid(row=3, column=4, padx=15, pady=10)
+        tk.Button(input_frame, text="Monthly Report", command=self.save_monthly_reports, bg="#ff9800", fg="white").grid(row=3, column=5, padx=15, pady=10)
+        tk.Button(input_frame, text="Range Report", command=self.save_range_reports, bg="#795548", fg="white").grid(row=3, column=6, padx=15, pady=10)
         
         # Salesman Table
-        self.salesman_tree = ttk.Treeview(table_frame, columns=("ID", "Name", "Product", "Quantity", "Payment","Return"), show="headings")
+        self.salesman_tree = ttk.Treeview(table_frame, columns=("ID", "Name", "Product", "Quantity", "Payment", "Return", "Date"), show="headings")
         self.salesman_tree.heading("ID", text="ID")
         self.salesman_tree.heading("Name", text="Name")
         self.salesman_tree.heading("Product", text="Product")
         self.salesman_tree.heading("Quantity", text="Quantity")
         self.salesman_tree.heading("Payment", text="Payment")
         self.salesman_tree.heading("Return", text="Return")
+        self.salesman_tree.heading("Date", text="Date")
 
         # Align columns to the center
-        for col in ["ID", "Name", "Product", "Quantity", "Payment", "Return"]:
+        for col in ["ID", "Name", "Product", "Quantity", "Payment", "Return", "Date"]:
             self.salesman_tree.column(col, anchor="center")
 
         # Add scrollbar for the treeview
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.salesman_tree.yview)
-        self.salesman_tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # Rows are fetched page by page as the table is scrolled
+        self.salesman_table = PagedTable(self.salesman_tree, scrollbar, self.db, "salesman", SALESMAN_COLUMNS)
+
         # Pack the treeview to display the table
         self.salesman_tree.pack(fill=tk.BOTH, expand=True)
 
@@ -106,64 +131,105 @@ class SalesmanManager:
             messagebox.showwarning("Input Error", "All fields are required!")
             return
 
-        # Check if the product exists in the inventory database (case-insensitive)
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, quantity, price_per_kg FROM inventory WHERE LOWER(name) = LOWER(?)", (product,))
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            messagebox.showwarning("Product Error", f"The product '{product}' does not exist in the inventory!")
+        def done(_):
+            # Clear fields
+            self.salesman_name_var.set("")
+            self.salesman_product_var.set("")
+            self.salesman_quantity_var.set(0)
+            # Only this salesman's report needs rendering again
+            self.save_reports([name])
+
+        self.jobs.submit(services.issue_stock, self.db, name, product, quantity,
+                         on_done=done, on_error=self.show_error, description="Issuing stock...")
+
+    def save_reports(self, salesmen=None):
+        # Write the PDF reports in the background, showing progress in the status bar.
+        # salesmen limits it to the reports whose data changed
+        def progress(done, total):
+            self.jobs.status_var.set(f"Saving reports {done}/{total}...")
+
+        def done(result):
+            _, errors = result
+            for _, _, message in errors:
+                messagebox.showerror("File Save Error", message)
+
+        self.jobs.submit(generate_salesman_reports, self.db, salesmen=salesmen,
+                         on_done=done, on_error=self.show_error, on_progress=progress, description="Saving reports...")
+
+    def save_monthly_reports(self):
+        # This month's totals per salesman, from the monthly rollup
+        def progress(done, total):
+            self.jobs.status_var.set(f"Saving monthly reports {done}/{total}...")
+
+        def done(result):
+            written, errors = result
+            for _, _, message in errors:
+                messagebox.showerror("File Save Error", message)
+            if not errors:
+                messagebox.showinfo("Monthly Report", f"Saved {len(written)} monthly reports.")
+
+        self.jobs.submit(generate_monthly_reports, self.db,
+                         on_done=done, on_error=self.show_error, on_progress=progress, description="Saving monthly reports...")
+
+    def save_range_reports(self):
+        # Totals per salesman and for everyone over the days the user picks
+        today = datetime.now().strftime("%Y-%m-%d")
+        start = simpledialog.askstring("Range Report", "First day (YYYY-MM-DD):", initialvalue=today[:8] + "01", parent=self.root)
+        if not start:
             return
-
-        # Extract the product data from the query result
-        product_id, product_name, inventory_quantity, price_per_kg = result
-
-        # Check if the entered quantity is greater than available quantity
-        if quantity > inventory_quantity:
-            conn.close()
-            messagebox.showwarning("Quantity Error", f"Entered quantity ({quantity}) exceeds available quantity ({inventory_quantity}) in the inventory!")
+        last = simpledialog.askstring("Range Report", "Last day (YYYY-MM-DD):", initialvalue=today, parent=self.root)
+        if not last:
+            return
+        try:
+            first_day = datetime.strptime(start.strip(), "%Y-%m-%d")
+            last_day = datetime.strptime(last.strip(), "%Y-%m-%d")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Dates must be written as YYYY-MM-DD.")
+            return
+        if last_day < first_day:
+            messagebox.showwarning("Input Error", "The last day can't be before the first day.")
             return
 
-        # Subtract the quantity from the inventory
-        new_quantity = inventory_quantity - quantity
-        total_price = new_quantity * price_per_kg
+        def progress(done, total):
+            self.jobs.status_var.set(f"Saving range reports {done}/{total}...")
 
-        # Update the inventory with the new quantity and total price
-        cursor.execute("UPDATE inventory SET quantity = ?, total_price = ? WHERE id = ?", (new_quantity, total_price, product_id))
-        conn.commit()
+        def done(result):
+            written, errors = result
+            for _, _, message in errors:
+                messagebox.showerror("File Save Error", message)
+            if not errors:
+                messagebox.showinfo("Range Report", f"Saved {len(written)} reports.")
 
-        # Calculate the payment (quantity * price_per_kg)
-        payment = quantity * price_per_kg
+        self.jobs.submit(generate_range_reports, self.db, first_day.strftime("%Y-%m-%d"),
+                         (last_day + timedelta(days=1)).strftime("%Y-%m-%d"),
+                         on_done=done, on_error=self.show_error, on_progress=progress, description="Saving range reports...")
 
-        # Add the salesman record to the salesman table, including the calculated payment
-        conn = sqlite3.connect("salesman.db")
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO salesman (name, product, quantity, payment) VALUES (?, ?, ?, ?)", (name, product, quantity, payment))
-        conn.commit()
-        conn.close()
+    def show_error(self, error):
+        if isinstance(error, ServiceError):
+            messagebox.showwarning(error.title, error.message)
+        else:
+            messagebox.showerror("Database Error", str(error))
 
-        # Clear fields and refresh salesmen view
-        self.salesman_name_var.set("")
-        self.salesman_product_var.set("")
-        self.salesman_quantity_var.set(0)
-        self.view_salesmen()
-        generate_salesman_reports()
+    def import_salesman_issues(self):
+        # Issue stock for many rows of a CSV/JSON file in the background
+        path = filedialog.askopenfilename(title="Import Issues",
+                                          filetypes=[("CSV or JSON", "*.csv *.json *.jsonl *.ndjson"), ("All files", "*.*")])
+        if not path:
+            return
 
+        def progress(done, total):
+            self.jobs.status_var.set(f"Importing... {done} rows read")
 
-    def view_salesmen(self):
-        conn = sqlite3.connect("salesman.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM salesman")
-        rows = cursor.fetchall()
-        conn.close()
+        def done(result):
+            show_import_result(result)
+            self.save_reports()
 
-        for row in self.salesman_tree.get_children():
-            self.salesman_tree.delete(row)
+        self.jobs.submit(import_issues, self.db, path,
+                         on_done=done, on_error=self.show_error, on_progress=progress, description="Importing issues...")
 
-        for row in rows:
-            self.salesman_tree.insert("", tk.END, values=row)
+    def view_salesmen(self):
+        # Show the first page again
+        self.salesman_table.reload()
 
     def erase_all_data(self):
         # Show a confirmation dialog
@@ -171,16 +237,15 @@ class SalesmanManager:
         
         # If the user clicks "Yes", proceed with deletion
         if response:
-            conn = sqlite3.connect("salesman.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM salesman")  # Deletes all rows from the table
-            conn.commit()
-            conn.close()
-            messagebox.showinfo("Success", "All data has been deleted.")
+            def done(_):
+                messagebox.showinfo("Success", "All data has been deleted.")
+                self.view_salesmen()
+
+            # Deletes all rows from the table
+            self.jobs.submit(services.clear_sales, self.db,
+                             on_done=done, on_error=self.show_error, description="Deleting sales data...")
         else:
             messagebox.showinfo("Cancelled", "Data deletion has been cancelled.")
-            
-        self.view_salesmen()
 
 
     def edit_salesman(self, event):
@@ -194,6 +259,8 @@ class SalesmanManager:
         # Variables for current quantity and product name
         current_quantity = record[3]
         product = record[2]
+        returned = record[5] or 0
+        remaining = current_quantity - int(returned)
 
         self.salesman_return_var = tk.IntVar(value=0)  # New variable for "return"
 
@@ -204,53 +271,25 @@ class SalesmanManager:
                 messagebox.showwarning("Input Error", "Return quantity must be greater than 0!")
                 return
 
-            if return_value > current_quantity:
-                messagebox.showwarning("Input Error", "Return quantity cannot be greater than the current quantity!")
-                return
-
-            # Fetch price_per_kg from the inventory database
-            conn = sqlite3.connect("inventory.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT quantity, price_per_kg FROM inventory WHERE LOWER(name) = LOWER(?)", (product,))
-            result = cursor.fetchone()
-
-            if not result:
-                conn.close()
-                messagebox.showwarning("Product Error", f"The product '{product}' does not exist in the inventory!")
+            # Checked again when the return is saved, in case another
+            # workstation has taken stock back for this record meanwhile
+            if return_value > remaining:
+                messagebox.showwarning("Input Error", "Return quantity cannot be greater than what is left with the salesman!")
                 return
 
-            inventory_quantity, price_per_kg = result
-
-            # Update the inventory with the returned quantity
-            new_inventory_quantity = inventory_quantity + return_value
-            total_price = new_inventory_quantity * price_per_kg
-
-            cursor.execute("UPDATE inventory SET quantity=?, total_price=? WHERE LOWER(name) = LOWER(?)",
-                        (new_inventory_quantity, total_price, product))
-            conn.commit()
-            conn.close()
-
-            # Update the salesman's record with the new quantity and payment
-            new_salesman_quantity = current_quantity #- return_value
-            payment = (new_salesman_quantity - return_value )* price_per_kg  # Recalculate payment
-
-            conn = sqlite3.connect("salesman.db")
-            cursor = conn.cursor()
-            cursor.execute("UPDATE salesman SET quantity=?, payment=?, return=? WHERE id=?",
-                        (new_salesman_quantity, payment, return_value, record[0]))
-            conn.commit()
-            conn.close()
-            generate_salesman_reports()
+            def done(_):
+                self.save_reports([record[1]])
+                top.destroy()
 
-            self.view_salesmen()
-            top.destroy()
+            self.jobs.submit(services.return_stock, self.db, record[0], return_value,
+                             on_done=done, on_error=self.show_error, description="Returning stock...")
 
         # Create a new top-level window to ask for the return quantity
         top = tk.Toplevel(self.root)
         top.title("Enter Return Quantity")
 
         tk.Label(top, text=f"Product: {product}").grid(row=0, column=0, padx=10, pady=10, columnspan=2)
-        tk.Label(top, text=f"Current Quantity: {current_quantity}").grid(row=1, column=0, padx=10, pady=10, columnspan=2)
+        tk.Label(top, text=f"Current Quantity: {current_quantity} (returned so far: {returned})").grid(row=1, column=0, padx=10, pady=10, columnspan=2)
 
         tk.Label(top, text="Return Quantity").grid(row=2, column=0, padx=10, pady=10)
         tk.Entry(top, textvariable=self.salesman_return_var).grid(row=2, column=1, padx=10, pady=10)
@@ -0,0 +1,46 @@
+# Type-ahead search over product names and categories.
+# Text of three characters or more is looked up as a substring in the
+# inventory_search trigram index; shorter text is matched as a name prefix on
+# the LOWER(name) index. Neither has to scan the inventory table.
+
+MIN_SUBSTRING = 3  # trigrams need at least three characters
+SUGGESTION_LIMIT = 10
+DEBOUNCE_MS = 150  # wait for typing to pause before querying
+
+def prefix_range(text):
+    # Every string starting with text sorts between these two
+    return text, text + "\U0010ffff"
+
+def fts_phrase(text):
+    # Quote the text so FTS5 treats it as one literal phrase
+    return '"' + text.replace('"', '""') + '"'
+
+def match_clause(text):
+    # Returns (where, params) selecting the inventory rows whose name or
+    # category contains text, e.g. for PagedTable.set_filter
+    text = text.strip().lower()
+    if not text:
+        return "1", ()
+    if len(text) >= MIN_SUBSTRING:
+        return "id IN (SELECT rowid FROM inventory_search WHERE inventory_search MATCH ?)", (fts_phrase(text),)
+    return "LOWER(name) >= ? AND LOWER(name) < ?", prefix_range(text)
+
+def suggest_products(fetch, text, limit=SUGGESTION_LIMIT):
+    # Product names for the autocomplete: names starting with text first,
+    # then names containing it
+    text = text.strip().lower()
+    if not text:
+        return []
+    rows = fetch("""
+        SELECT name FROM inventory
+        WHERE LOWER(name) >= ? AND LOWER(name) < ?
+        ORDER BY LOWER(name) LIMIT ?
+    """, prefix_range(text) + (limit,))
+    names = [row[0] for row in rows]
+
+    if len(names) < limit and len(text) >= MIN_SUBSTRING:
+        rows = fetch("SELECT name FROM inventory_search WHERE name MATCH ? LIMIT ?",
+                     (fts_phrase(text), limit + len(names)))
+        seen = set(names)
+        names += [row[0] for row in rows if row[0] not in seen][:limit - len(names)]
+    return names
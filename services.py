@@ -0,0 +1,443 @@
+from Databases import NOW_SQL, BUMP_VERSION
+from ledger import record_movement, RECEIPT, ISSUE, RETURN, ADJUSTMENT
+from search import match_clause
+
+# Inventory and sales operations without any Tk: plain arguments in, results
+# out, and a ServiceError subclass raised for anything the user has to fix.
+# The Tk tabs, the bulk tools and scripts all go through these.
+#
+#   db = ConnectionManager()
+#   record_id = issue_stock(db, "ali", "lays", 5)
+#   return_stock(db, record_id, 2)
+#
+# Each batch variant (add_items, issue_many, return_many) runs in a single
+# transaction: either every entry is applied or, on the first error, none.
+# add_items and issue_many also take on_error(index, error), which instead
+# skips a failing entry (rolled back to a savepoint) and goes on with the rest.
+# The product cache and change listeners are updated once it has committed.
+#
+# Several workstations may share the database. Stock moves as relative
+# changes (quantity = quantity + ?) checked in the same statement, and an
+# edit made from values read earlier passes the row version it read, so a
+# change made elsewhere in between raises EditConflict instead of being lost.
+
+# Database columns returned by list_items / list_sales and shown in the tables
+INVENTORY_COLUMNS = ("id", "name", "quantity", "price_per_kg", "total_price", "category", "reorder_level")
+SALESMAN_COLUMNS = ("id", "name", "product", "quantity", "payment", "return", "created_at")
+LOW_STOCK_COLUMNS = ("id", "name", "quantity", "reorder_level")
+LOW_STOCK_CONDITION = "quantity < reorder_level"  # matches the idx_inventory_low_stock partial index
+ITEM_COLUMNS = INVENTORY_COLUMNS + ("version", "updated_at")  # get_item
+
+class ServiceError(Exception):
+    # An operation that can't be done; title and message are shown to the user
+    title = "Error"
+
+    def __init__(self, message, title=None):
+        super().__init__(message)
+        self.message = message
+        if title is not None:
+            self.title = title
+
+class InputError(ServiceError):
+    title = "Input Error"
+
+class ProductNotFound(ServiceError):
+    title = "Product Error"
+
+class InsufficientStock(ServiceError):
+    title = "Quantity Error"
+
+class PriceConflict(ServiceError):
+    title = "Price Error"
+
+class RecordNotFound(ServiceError):
+    title = "Record Error"
+
+class EditConflict(ServiceError):
+    # The row changed after the values being saved were read; current holds
+    # it as it is now (a get_item dict)
+    title = "Edit Conflict"
+
+    def __init__(self, message, current):
+        super().__init__(message)
+        self.current = current
+
+class ChangeSet:
+    # What a transaction changed, written through to the product cache and
+    # announced to listeners only after it has committed
+    def __init__(self):
+        self.products = {}  # lowercased name -> (id, name, quantity, price_per_kg), or None once deleted
+        self.inventory_ids = []
+        self.salesman_ids = []
+
+    def put(self, product):
+        self.products[product[1].lower()] = product
+
+    def remove(self, name):
+        self.products[name.lower()] = None
+
+    def publish(self, db):
+        for name, product in self.products.items():
+            if product is None:
+                db.products.remove(name)
+            else:
+                db.products.put(*product)
+        if self.inventory_ids:
+            db.notify("inventory", list(dict.fromkeys(self.inventory_ids)))
+        if self.salesman_ids:
+            db.notify("salesman", list(dict.fromkeys(self.salesman_ids)))
+
+def require_text(value, field):
+    value = str(value or "").strip()
+    if not value:
+        raise InputError(f"{field} is required!")
+    return value
+
+def require_salesman_name(value):
+    # The name is also the salesman's report folder, see pdf_generator.report_path
+    name = require_text(value, "Salesman name")
+    if "/" in name or "\\" in name or ".." in name:
+        raise InputError("Salesman name can't contain '/', '\\' or '..'!")
+    return name
+
+def require_number(value, field, allow_zero=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise InputError(f"{field} must be a number!")
+    if value < 0 or (value == 0 and not allow_zero):
+        raise InputError(f"{field} must be greater than {'or equal to ' if allow_zero else ''}0!")
+    return value
+
+# Inventory
+
+def add_item(db, name, qty, price_per_kg, category="", reorder_level=None):
+    # Adds stock to the item with this name and price, or creates it.
+    # reorder_level, when given, replaces the item's minimum stock.
+    # Returns the item's id; raises PriceConflict if the name exists with another price
+    return add_items(db, [(name, qty, price_per_kg, category, reorder_level)])[0]
+
+def add_items(db, items, on_error=None):
+    # items: (name, qty, price_per_kg[, category[, reorder_level]]) tuples.
+    # Returns their ids, None for the entries skipped through on_error
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        ids = apply_each(cursor, items, lambda item: store_item(cursor, changes, *validate_item(*item)), on_error)
+    changes.publish(db)
+    return ids
+
+def apply_each(cursor, entries, apply, on_error=None):
+    # apply(entry) for every entry in the open transaction. Without on_error
+    # the first ServiceError ends the batch; with it, each entry runs under a
+    # savepoint, so a failing one is undone and reported on its own
+    if on_error is None:
+        return [apply(entry) for entry in entries]
+    results = []
+    for index, entry in enumerate(entries):
+        cursor.execute("SAVEPOINT entry")
+        try:
+            results.append(apply(entry))
+        except ServiceError as e:
+            cursor.execute("ROLLBACK TO entry")
+            results.append(None)
+            on_error(index, e)
+        cursor.execute("RELEASE entry")
+    return results
+
+def validate_item(name, qty, price_per_kg, category="", reorder_level=None):
+    name = require_text(name, "Product name").lower()
+    qty = require_number(qty, "Quantity")
+    price_per_kg = require_number(price_per_kg, "Price per KG")
+    category = str(category or "").strip().lower()
+    if reorder_level is not None:
+        reorder_level = require_number(reorder_level, "Reorder level", allow_zero=True)
+    return name, qty, price_per_kg, category, reorder_level
+
+def store_item(cursor, changes, name, qty, price_per_kg, category, reorder_level):
+    # Check if an item with the same name (case-insensitive) exists
+    cursor.execute("SELECT id, quantity, price_per_kg FROM inventory WHERE LOWER(name) = ?", (name,))
+    existing = cursor.fetchall()
+    if any(price != price_per_kg for _, _, price in existing):
+        raise PriceConflict("An item with the same name but a different price already exists!")
+
+    if existing:
+        # Add to the existing item's quantity and total price
+        item_id = existing[0][0]
+        cursor.execute(f"""
+            UPDATE inventory
+            SET quantity = quantity + ?, total_price = (quantity + ?) * price_per_kg,
+                reorder_level = COALESCE(?, reorder_level), {BUMP_VERSION}
+            WHERE id = ?
+            RETURNING quantity
+        """, (qty, qty, reorder_level, item_id))
+        new_qty = cursor.fetchone()[0]
+    else:
+        # Add new item
+        new_qty = qty
+        cursor.execute("""
+            INSERT INTO inventory (name, quantity, price_per_kg, total_price, category, reorder_level)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, qty, price_per_kg, qty * price_per_kg, category, reorder_level or 0))
+        item_id = cursor.lastrowid
+
+    # Record the delivery in the stock ledger
+    record_movement(cursor, item_id, name, RECEIPT, qty, price_per_kg)
+    changes.put((item_id, name, new_qty, price_per_kg))
+    changes.inventory_ids.append(item_id)
+    return item_id
+
+def get_item(db, item_id):
+    # The item as it is now, with its version, as a dict of ITEM_COLUMNS
+    rows = db.query(f"SELECT {', '.join(ITEM_COLUMNS)} FROM inventory WHERE id = ?", (item_id,))
+    if not rows:
+        raise ProductNotFound(f"No product with id {item_id} in the inventory!")
+    return dict(zip(ITEM_COLUMNS, rows[0]))
+
+def adjust_item(db, item_id, quantity, price_per_kg, reorder_level=None, version=None):
+    # Sets an item's stock and price (and reorder level, when given), e.g. after a stock count.
+    # version is the one the new values were based on (get_item); when the item
+    # has been changed since, EditConflict is raised and nothing is written
+    quantity = require_number(quantity, "Quantity", allow_zero=True)
+    price_per_kg = require_number(price_per_kg, "Price per KG")
+    if reorder_level is not None:
+        reorder_level = require_number(reorder_level, "Reorder level", allow_zero=True)
+
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        cursor.execute("SELECT name, quantity, version FROM inventory WHERE id = ?", (item_id,))
+        existing_item = cursor.fetchone()
+        if not existing_item:
+            raise ProductNotFound(f"No product with id {item_id} in the inventory!")
+        name, old_qty, current_version = existing_item
+        if version is None:
+            version = current_version
+
+        # Compare and swap: only the version that was read is overwritten
+        cursor.execute(f"""
+            UPDATE inventory
+            SET quantity = ?, price_per_kg = ?, total_price = ?, reorder_level = COALESCE(?, reorder_level), {BUMP_VERSION}
+            WHERE id = ? AND version = ?
+        """, (quantity, price_per_kg, quantity * price_per_kg, reorder_level, item_id, version))
+        if cursor.rowcount == 0:
+            raise EditConflict(f"'{name}' was changed by someone else while you were editing it.", get_item(db, item_id))
+
+        # The ledger keeps the correction as a change in stock
+        record_movement(cursor, item_id, name, ADJUSTMENT, quantity - old_qty, price_per_kg)
+        changes.put((int(item_id), name, quantity, price_per_kg))
+        changes.inventory_ids.append(int(item_id))
+    changes.publish(db)
+    return int(item_id)
+
+def adjust_item_by(db, item_id, change, price_per_kg=None, reorder_level=None):
+    # Changes an item's stock by change (and sets its price and reorder level,
+    # when given) on top of whatever it holds now, e.g. to apply an edit after
+    # EditConflict without undoing the other change
+    change = int(change)
+    if price_per_kg is not None:
+        price_per_kg = require_number(price_per_kg, "Price per KG")
+    if reorder_level is not None:
+        reorder_level = require_number(reorder_level, "Reorder level", allow_zero=True)
+
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        cursor.execute(f"""
+            UPDATE inventory
+            SET quantity = quantity + ?, price_per_kg = COALESCE(?, price_per_kg),
+                total_price = (quantity + ?) * COALESCE(?, price_per_kg),
+                reorder_level = COALESCE(?, reorder_level), {BUMP_VERSION}
+            WHERE id = ? AND quantity + ? >= 0
+            RETURNING id, name, quantity, price_per_kg
+        """, (change, price_per_kg, change, price_per_kg, reorder_level, item_id, change))
+        result = cursor.fetchone()
+        if not result:
+            current = get_item(db, item_id)
+            raise InsufficientStock(f"Not enough stock of '{current['name']}': {current['quantity']} left, "
+                                    f"{-change} to take off.")
+        if change:
+            record_movement(cursor, item_id, result[1], ADJUSTMENT, change, result[3])
+        changes.put(result)
+        changes.inventory_ids.append(int(item_id))
+    changes.publish(db)
+    return int(item_id)
+
+def list_low_stock(db, ids=None):
+    # (id, name, quantity, reorder_level) of the items below their reorder
+    # level, all of them or only among ids, through the partial index
+    if ids is None:
+        return db.query(f"SELECT {', '.join(LOW_STOCK_COLUMNS)} FROM inventory WHERE {LOW_STOCK_CONDITION} ORDER BY id")
+    ids = [int(item_id) for item_id in ids]
+    if not ids:
+        return []
+    return db.query(f"""
+        SELECT {', '.join(LOW_STOCK_COLUMNS)} FROM inventory
+        WHERE id IN ({', '.join('?' for _ in ids)}) AND {LOW_STOCK_CONDITION}
+        ORDER BY id
+    """, tuple(ids))
+
+def delete_item(db, item_id):
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM inventory WHERE id = ? RETURNING name, quantity, price_per_kg", (item_id,))
+        deleted = cursor.fetchone()
+        if not deleted:
+            raise ProductNotFound(f"No product with id {item_id} in the inventory!")
+        # Write off whatever stock the item still had
+        name, qty, price_per_kg = deleted
+        record_movement(cursor, item_id, name, ADJUSTMENT, -qty, price_per_kg)
+        changes.remove(name)
+        changes.inventory_ids.append(int(item_id))
+    changes.publish(db)
+    return int(item_id)
+
+def list_items(db, search="", after_id=0, limit=100):
+    # One page of inventory rows (INVENTORY_COLUMNS) with id > after_id,
+    # optionally only those whose name or category matches search
+    where, params = match_clause(search)
+    return db.query(f"""
+        SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory
+        WHERE ({where}) AND id > ? ORDER BY id LIMIT ?
+    """, params + (after_id, limit))
+
+# Sales
+
+def issue_stock(db, name, product, quantity):
+    # Gives a salesman stock. Returns the new salesman record's id
+    return issue_many(db, [(name, product, quantity)])[0]
+
+def issue_many(db, issues, on_error=None):
+    # issues: (salesman, product, quantity) tuples. Returns the record ids,
+    # None for the entries skipped through on_error
+    def issue(entry):
+        name, product, quantity = entry
+        name = require_salesman_name(name)
+        product = require_text(product, "Product name")
+        quantity = require_number(quantity, "Quantity")
+        # The product is resolved through the catalog cache, the stock itself
+        # is checked by the conditional UPDATE in take_stock
+        return issue_one(db, cursor, changes, cached_product(db, product), name, product, quantity)
+
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        record_ids = apply_each(cursor, issues, issue, on_error)
+    changes.publish(db)
+    return record_ids
+
+def issue_one(db, cursor, changes, entry, name, product, quantity):
+    result = take_stock(cursor, entry.id, product, -quantity, quantity)
+    if not result:
+        # Nothing was taken, find out why. The cached entry may also be
+        # stale if the product was deleted and re-added, or its id reused
+        stock = resolve_stale(db, cursor, entry, product)
+        if stock[0] != entry.id:
+            result = take_stock(cursor, stock[0], product, -quantity, quantity)
+        if not result:
+            raise InsufficientStock(f"Entered quantity ({quantity}) exceeds available quantity ({stock[2]}) in the inventory!")
+
+    # Calculate the payment (quantity * price_per_kg)
+    product_id, _, _, price_per_kg = result
+    cursor.execute(f"INSERT INTO salesman (name, product, quantity, payment, created_at) VALUES (?, ?, ?, ?, {NOW_SQL})",
+                   (name, product, quantity, quantity * price_per_kg))
+    record_id = cursor.lastrowid
+    record_movement(cursor, product_id, product, ISSUE, -quantity, price_per_kg, name, record_id)
+
+    changes.put(result)
+    changes.inventory_ids.append(product_id)
+    changes.salesman_ids.append(record_id)
+    return record_id
+
+def return_stock(db, record_id, quantity):
+    # Takes back part of what a salesman record was issued and recalculates
+    # its payment from what the salesman kept. Returns the record id
+    return return_many(db, [(record_id, quantity)])[0]
+
+def return_many(db, returns):
+    # returns: (record_id, quantity) tuples. Returns the record ids
+    returns = [(record_id, require_number(quantity, "Return quantity")) for record_id, quantity in returns]
+    changes = ChangeSet()
+    with db.transaction() as cursor:
+        record_ids = [return_one(db, cursor, changes, *item) for item in returns]
+    changes.publish(db)
+    return record_ids
+
+def return_one(db, cursor, changes, record_id, quantity):
+    # Returns add up: the record keeps the total returned so far, and the
+    # check below sees any return made from another workstation, as the
+    # transaction holds the write lock
+    cursor.execute("SELECT name, product, quantity, COALESCE(return, 0) FROM salesman WHERE id = ?", (record_id,))
+    record = cursor.fetchone()
+    if not record:
+        raise RecordNotFound(f"No salesman record with id {record_id}!")
+    name, product, issued, returned = record
+    if quantity > issued - returned:
+        raise InputError(f"Return quantity cannot be greater than what is left with the salesman ({issued - returned})!")
+
+    # Put the stock back
+    entry = cached_product(db, product)
+    result = take_stock(cursor, entry.id, product, quantity)
+    if not result:
+        # The cached entry is stale, look the product up again
+        stock = resolve_stale(db, cursor, entry, product)
+        result = take_stock(cursor, stock[0], product, quantity)
+
+    product_id, _, _, price_per_kg = result
+    cursor.execute(f"""
+        UPDATE salesman
+        SET return = COALESCE(return, 0) + ?, payment = (quantity - COALESCE(return, 0) - ?) * ?, {BUMP_VERSION}
+        WHERE id = ?
+    """, (quantity, quantity, price_per_kg, record_id))
+    record_movement(cursor, product_id, product, RETURN, quantity, price_per_kg, name, record_id)
+
+    changes.put(result)
+    changes.inventory_ids.append(product_id)
+    changes.salesman_ids.append(int(record_id))
+    return int(record_id)
+
+def list_sales(db, salesman=None, after_id=0, limit=100):
+    # One page of salesman records (SALESMAN_COLUMNS) with id > after_id
+    where, params = ("LOWER(name) = LOWER(?)", (salesman,)) if salesman else ("1", ())
+    return db.query(f"""
+        SELECT {', '.join(SALESMAN_COLUMNS)} FROM salesman
+        WHERE {where} AND id > ? ORDER BY id LIMIT ?
+    """, params + (after_id, limit))
+
+def clear_sales(db):
+    # Deletes every salesman record. Returns how many there were.
+    # The daily and monthly sales totals are kept
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM salesman")
+        return cursor.rowcount
+
+# Helpers
+
+def cached_product(db, product):
+    entry = db.products.get(product, db.query)
+    if entry is None:
+        raise ProductNotFound(f"The product '{product}' does not exist in the inventory!")
+    return entry
+
+def take_stock(cursor, product_id, product, change, minimum=0):
+    # Changes a product's stock by change as long as at least minimum is left
+    # beforehand. Returns the updated (id, name, quantity, price_per_kg) or None.
+    # The name is checked too: a cached id may have been reused for another
+    # product after a delete elsewhere
+    cursor.execute(f"""
+        UPDATE inventory
+        SET quantity = quantity + ?, total_price = (quantity + ?) * price_per_kg, {BUMP_VERSION}
+        WHERE id = ? AND LOWER(name) = LOWER(?) AND quantity >= ?
+        RETURNING id, name, quantity, price_per_kg
+    """, (change, change, product_id, product, minimum))
+    return cursor.fetchone()
+
+def resolve_stale(db, cursor, entry, product):
+    # Looks product up after take_stock found nothing with the cached entry.
+    # Returns its (id, name, quantity, price_per_kg); the cache is only
+    # corrected when the entry really was wrong, not for a lack of stock
+    stock = find_product(cursor, product)
+    if not stock:
+        db.products.remove(product)
+        raise ProductNotFound(f"The product '{product}' does not exist in the inventory!")
+    if stock[0] != entry.id:
+        db.products.put(*stock)
+    return stock
+
+def find_product(cursor, product):
+    cursor.execute("SELECT id, name, quantity, price_per_kg FROM inventory WHERE LOWER(name) = LOWER(?)", (product,))
+    return cursor.fetchone()
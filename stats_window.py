@@ -0,0 +1,77 @@
+import tkinter as tk
+from tkinter import ttk
+import instrumentation
+
+# Live view of instrumentation.summary(): one row per operation over the
+# latest instrumentation.WINDOW operations, refreshed every second.
+
+COLUMNS = (
+    ("Operation", "operation", 200),
+    ("Count", "count", 60),
+    ("Failed", "failed", 60),
+    ("Avg ms", "avg_ms", 70),
+    ("p50 ms", "p50_ms", 70),
+    ("p99 ms", "p99_ms", 70),
+    ("Max ms", "max_ms", 70),
+    ("Queries", "queries", 70),
+    ("Rows", "rows", 70),
+    ("Insert ms", "tree_insert_ms", 70),
+    ("Render ms", "render_ms", 70),
+    ("Write ms", "write_ms", 70),
+)
+REFRESH_MS = 1000
+
+class StatsWindow:
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Operation Stats")
+        self.window.geometry("1000x400")
+
+        self.tree = ttk.Treeview(self.window, columns=[title for title, _, _ in COLUMNS], show="headings")
+        for title, _, width in COLUMNS:
+            self.tree.heading(title, text=title)
+            self.tree.column(title, anchor="w" if title == "Operation" else "e", width=width)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        buttons = tk.Frame(self.window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Reset", command=self.reset).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(buttons, text="Profile Next Operation", command=self.profile_next).pack(side=tk.LEFT, padx=5, pady=5)
+        self.profile_var = tk.StringVar(master=self.window, value="")
+        tk.Label(buttons, textvariable=self.profile_var, anchor="w").pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.pending = None
+        self.refresh()
+
+    def refresh(self):
+        self.pending = None
+        if not self.window.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        # Slowest in total first
+        stats = sorted(instrumentation.summary().items(), key=lambda item: -item[1]["total_ms"])
+        for name, values in stats:
+            row = [name]
+            for _, key, _ in COLUMNS[1:]:
+                value = values.get(key)
+                row.append("" if value is None else value if isinstance(value, int) else f"{value:.2f}")
+            self.tree.insert("", tk.END, values=row)
+
+        if instrumentation.profile_request is not None:
+            self.profile_var.set(f"Profiling the next {instrumentation.profile_request or 'operation'}...")
+        elif instrumentation.last_profile:
+            self.profile_var.set(f"Last profile: {instrumentation.last_profile}")
+        self.pending = self.window.after(REFRESH_MS, self.refresh)
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh_now()
+
+    def profile_next(self):
+        instrumentation.profile_next()
+        self.refresh_now()
+
+    def refresh_now(self):
+        if self.pending is not None:
+            self.window.after_cancel(self.pending)
+        self.refresh()
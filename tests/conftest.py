@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Databases import setup_databases
+from data_access import ConnectionManager
+
+@pytest.fixture
+def db_path(tmp_path):
+    # A fresh database at SCHEMA_VERSION, with no legacy salesman.db to merge
+    path = str(tmp_path / "inventory.db")
+    setup_databases(path, str(tmp_path / "salesman.db"))
+    return path
+
+@pytest.fixture
+def db(db_path):
+    db = ConnectionManager(db_path)
+    yield db
+    db.close()
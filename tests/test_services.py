@@ -0,0 +1,155 @@
+import sqlite3
+
+import pytest
+
+import services
+from Databases import setup_databases, check_sales_rollups, ROLLUP_REBUILD_VERSION
+from data_access import ConnectionManager
+from bulk_import import import_inventory, import_issues
+
+def stock(db, name):
+    return db.query("SELECT quantity FROM inventory WHERE LOWER(name) = ?", (name,))[0][0]
+
+def test_issue_and_return_stock(db):
+    services.add_item(db, "pepsi", 10, 5)
+    record_id = services.issue_stock(db, "ali", "pepsi", 4)
+    assert stock(db, "pepsi") == 6
+
+    services.return_stock(db, record_id, 1)
+    assert stock(db, "pepsi") == 7
+    assert db.query("SELECT quantity, return, payment FROM salesman WHERE id = ?", (record_id,)) == [(4, 1, 15.0)]
+    assert db.query("SELECT issued, returned, issue_count, payment FROM sales_monthly") == [(4, 1, 1, 15.0)]
+
+def test_return_more_than_left(db):
+    services.add_item(db, "pepsi", 10, 5)
+    record_id = services.issue_stock(db, "ali", "pepsi", 2)
+    with pytest.raises(services.InputError):
+        services.return_stock(db, record_id, 3)
+    assert stock(db, "pepsi") == 8
+
+def test_insufficient_stock_keeps_cache_entry(db):
+    item_id = services.add_item(db, "pepsi", 3, 5)
+    with pytest.raises(services.InsufficientStock):
+        services.issue_stock(db, "ali", "pepsi", 4)
+    assert stock(db, "pepsi") == 3
+    assert db.products.get("pepsi").id == item_id
+
+def test_adjust_item_compare_and_swap(db):
+    item_id = services.add_item(db, "pepsi", 10, 5)
+    seen = services.get_item(db, item_id)
+    services.issue_stock(db, "ali", "pepsi", 2)
+
+    # Saved against the version read before the issue
+    with pytest.raises(services.EditConflict) as conflict:
+        services.adjust_item(db, item_id, 20, 5, version=seen["version"])
+    assert conflict.value.current["quantity"] == 8
+    assert stock(db, "pepsi") == 8
+
+    current = services.get_item(db, item_id)
+    services.adjust_item(db, item_id, 20, 5, version=current["version"])
+    assert services.get_item(db, item_id)["version"] == current["version"] + 1
+    assert stock(db, "pepsi") == 20
+
+def test_stale_cache_with_reused_id(db, db_path):
+    other = ConnectionManager(db_path)
+    try:
+        pepsi_id = services.add_item(db, "pepsi", 10, 5)
+        assert db.products.get("pepsi").id == pepsi_id
+
+        # Deleted elsewhere, and its id given to another product
+        services.delete_item(other, pepsi_id)
+        assert services.add_item(other, "gold", 10, 27000) == pepsi_id
+
+        with pytest.raises(services.ProductNotFound):
+            services.issue_stock(db, "ali", "pepsi", 1)
+        assert stock(db, "gold") == 10
+        assert db.products.get("pepsi") is None
+
+        # Added back elsewhere under a new id: the cached entry is looked up again
+        new_id = services.add_item(other, "pepsi", 10, 5)
+        services.issue_stock(db, "ali", "pepsi", 1)
+        assert db.products.get("pepsi").id == new_id
+        assert stock(db, "pepsi") == 9
+        assert db.query("SELECT payment FROM salesman") == [(5.0,)]
+    finally:
+        other.close()
+
+def test_rollup_backfill_counts_legacy_returns_once(db, db_path, tmp_path):
+    services.add_item(db, "pepsi", 100, 10)
+    # Issued before the ledger existed: a record with no issue movement
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO salesman (name, product, quantity, payment, return, created_at) "
+                 "VALUES ('ali', 'pepsi', 4, 40, 0, '2026-01-05 10:00:00')")
+    conn.commit()
+    # ... and returned after
+    services.return_stock(db, 1, 1)
+
+    conn.execute(f"PRAGMA user_version = {ROLLUP_REBUILD_VERSION - 1}")
+    conn.commit()
+    setup_databases(db_path, str(tmp_path / "salesman.db"))
+    assert conn.execute("SELECT issued, returned, issue_count, payment FROM sales_monthly").fetchall() == [(4, 1, 1, 30.0)]
+
+    conn.execute("UPDATE sales_daily SET returned = returned + 1")
+    assert len(check_sales_rollups(conn)) == 1
+    conn.close()
+
+def test_cleared_record_ids_are_not_reused(db, db_path, tmp_path):
+    services.add_item(db, "pepsi", 10, 5)
+    first_id = services.issue_stock(db, "ali", "pepsi", 4)
+    services.clear_sales(db)
+    assert services.issue_stock(db, "ali", "pepsi", 3) != first_id
+
+    # Migrating again rebuilds the same rollups and keeps the sequence going
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA user_version = 7")
+    conn.commit()
+    setup_databases(db_path, str(tmp_path / "salesman.db"))
+    assert conn.execute("SELECT issued, issue_count FROM sales_monthly").fetchall() == [(7, 2)]
+    assert check_sales_rollups(conn) == []
+    conn.close()
+    assert services.issue_stock(db, "ali", "pepsi", 1) > first_id + 1
+
+def test_import_issues_rejects_bad_rows(db, tmp_path):
+    services.add_item(db, "pepsi", 5, 10)
+    path = tmp_path / "issues.jsonl"
+    path.write_text('{"salesman": "ali", "product": "pepsi", "quantity": 2}\n'
+                    '{broken\n'
+                    '["ali", "pepsi", 1]\n'
+                    '{"salesman": "sara", "product": "pepsi", "quantity": 9}\n'
+                    '{"salesman": "sara", "product": "pepsi", "quantity": 3}\n')
+
+    result = import_issues(db, str(path))
+    assert result.imported == 2
+    assert sorted(line for line, _ in result.rejected) == [2, 3, 4]
+    assert stock(db, "pepsi") == 0
+    assert db.query("SELECT COUNT(*) FROM stock_movements WHERE kind = 'issue'") == [(2,)]
+
+@pytest.mark.parametrize("name", ["/tmp/evil", "../evil", "a\\b", ".."])
+def test_issue_rejects_names_that_leave_the_report_folder(db, name):
+    services.add_item(db, "pepsi", 10, 5)
+    with pytest.raises(services.InputError):
+        services.issue_stock(db, name, "pepsi", 1)
+    assert stock(db, "pepsi") == 10
+
+def test_import_inventory_rejects_rows_without_stopping_the_chunk(db, tmp_path):
+    path = tmp_path / "delivery.jsonl"
+    path.write_text('{"name": "pepsi", "quantity": 5, "price_per_kg": 10}\n'
+                    '{"name": "pepsi", "quantity": 1, "price_per_kg": 12}\n'
+                    '{"name": "gold", "quantity": 2.7, "price_per_kg": 5}\n'
+                    '{"name": "gold", "quantity": true, "price_per_kg": 5}\n'
+                    '{"name": "gold", "quantity": 3.0, "price_per_kg": 5}\n')
+
+    result = import_inventory(db, str(path))
+    assert result.imported == 2
+    assert sorted(line for line, _ in result.rejected) == [2, 3, 4]
+    assert stock(db, "pepsi") == 5
+    assert stock(db, "gold") == 3
+
+def test_transaction_refuses_a_stray_open_transaction(db):
+    services.add_item(db, "pepsi", 10, 5)
+    db.conn.execute("UPDATE inventory SET quantity = 0")
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            pass
+    db.conn.rollback()
+    assert stock(db, "pepsi") == 10
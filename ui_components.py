@@ -2,16 +2,35 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from inventory import InventoryManager
 from salesman import SalesmanManager
+from job_executor import JobExecutor
+import instrumentation
+from stats_window import StatsWindow
 
 class InventoryApp:
-    def __init__(self, root):
+    def __init__(self, root, db):
         self.root = root
+        self.db = db
         self.root.title("Inventory and Salesman Management")
         self.root.geometry("800x600")
 
+        # Background worker for database and report work; change notifications
+        # from the worker are handed back to the Tk thread
+        self.jobs = JobExecutor(self.root)
+        self.db.dispatch = self.jobs.call_soon
+
         # Create InventoryManager and SalesmanManager instances
-        self.inventory_manager = InventoryManager(self.root)
-        self.salesman_manager = SalesmanManager(self.root)
+        self.inventory_manager = InventoryManager(self.root, self.db, self.jobs)
+        self.salesman_manager = SalesmanManager(self.root, self.db, self.jobs)
+
+        # Status bar showing what the background worker is doing, with the
+        # timing stats next to it when started with --instrument
+        status_frame = tk.Frame(root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        if instrumentation.enabled:
+            tk.Button(status_frame, text="Stats", command=self.show_stats).pack(side=tk.RIGHT)
+        self.status_bar = tk.Label(status_frame, textvariable=self.jobs.status_var, anchor="w", relief="sunken")
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.stats_window = None
 
         # Set up tabs for Inventory and Salesman
         self.notebook = ttk.Notebook(root)
@@ -19,3 +38,20 @@ class InventoryApp:
 
         self.inventory_tab = self.inventory_manager.create_inventory_tab(self.notebook)
         self.salesman_tab = self.salesman_manager.create_salesman_tab(self.notebook)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def load_data(self, on_done=None):
+        # Called once the window is on screen: the visible tab's rows, then the
+        # product cache, both on the background worker (lookups read through
+        # until then). on_done() runs once the rows are shown
+        self.inventory_manager.load_data(on_done)
+        self.jobs.submit(self.db.products.load, self.db.query, description="Loading products...")
+
+    def on_tab_changed(self, event=None):
+        if self.notebook.select() == str(self.salesman_tab):
+            self.salesman_manager.build_salesman_tab()
+
+    def show_stats(self):
+        if self.stats_window is None or not self.stats_window.window.winfo_exists():
+            self.stats_window = StatsWindow(self.root)
+        self.stats_window.window.lift()